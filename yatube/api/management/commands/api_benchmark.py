@@ -0,0 +1,72 @@
+import gzip
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import renderers, serializers
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает форматы ответа API по времени кодирования и размеру '
+        'на странице ленты из постов базы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=100,
+            help='Постов на странице ленты',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=200,
+            help='Число замеров на каждый формат',
+        )
+
+    def handle(self, *args, **options):
+        body = self.feed_page(options['page_size'])
+        if not body['results']:
+            raise CommandError(
+                'В базе нет постов: заполните её командой generate_data')
+        self.stdout.write(
+            f'Постов на странице: {len(body["results"])}; '
+            f'форматы: {", ".join(renderers.formats())}')
+        self.stdout.write(
+            f'{"формат":<10}{"мкс":>10}{"байт":>10}{"gzip":>10}'
+            f'{"размер":>10}')
+        baseline = None
+        for name in renderers.formats():
+            elapsed, size, compressed = self.measure(
+                name, body, options['repeat'])
+            baseline = baseline or size
+            self.stdout.write(
+                f'{name:<10}{elapsed * 1e6:>10.0f}{size:>10}'
+                f'{compressed:>10}{size / baseline:>10.0%}')
+
+    def feed_page(self, page_size):
+        # Та же страница, что отдаёт api:index, со всеми полями
+        fields = list(serializers.POST_FIELDS)
+        posts = serializers.load(
+            Post.objects.order_by('-created', '-id'), fields)[:page_size]
+        return {
+            'results': [serializers.post(post, fields) for post in posts],
+            'next_cursor': None,
+            'previous_cursor': None,
+        }
+
+    def measure(self, name, body, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = renderers.encode(name, body)
+            timings.append(time.perf_counter() - started)
+        return (
+            statistics.median(timings),
+            len(content),
+            len(gzip.compress(content)),
+        )
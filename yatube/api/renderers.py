@@ -0,0 +1,139 @@
+"""Форматы ответов API и выбор формата по заголовку Accept.
+
+* ``application/json`` - посты списком объектов, формат по умолчанию;
+* ``application/vnd.yatube.columnar+json`` - колоночный JSON: имена
+  полей один раз в ``columns``, посты - строками значений в ``rows``.
+  Авторы и группы записаны по разу в таблицах ``authors`` и ``groups``,
+  а в строках стоит номер в таблице;
+* ``application/msgpack`` - тот же колоночный ответ в msgpack. Нужен
+  пакет ``msgpack``; без него формат не предлагается, и клиент получает
+  JSON.
+
+Формат можно выбрать и параметром ``?format=json|columnar|msgpack``.
+"""
+import json
+from operator import itemgetter
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Таблица -> поля объектов, которые в неё выносятся
+LOOKUPS = {
+    'authors': ('author', 'author_name'),
+    'groups': ('group',),
+}
+
+
+def formats():
+    """Доступные форматы: имя -> тип содержимого."""
+    available = {
+        'json': 'application/json',
+        'columnar': 'application/vnd.yatube.columnar+json',
+    }
+    if msgpack is not None:
+        available['msgpack'] = 'application/msgpack'
+    return available
+
+
+def _accepted(header):
+    """Типы из заголовка Accept по убыванию q."""
+    ranges = []
+    for part in header.split(','):
+        media, *params = [value.strip() for value in part.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media and quality > 0:
+            ranges.append((quality, media))
+    ranges.sort(key=itemgetter(0), reverse=True)
+    return [media for _, media in ranges]
+
+
+def negotiate(request):
+    """Имя формата ответа для запроса."""
+    available = formats()
+    requested = request.GET.get('format')
+    if requested in available:
+        return requested
+    by_type = {
+        content_type: name for name, content_type in available.items()}
+    for media in _accepted(request.META.get('HTTP_ACCEPT', '')):
+        if media in by_type:
+            return by_type[media]
+        if media in ('*/*', 'application/*'):
+            break
+    return 'json'
+
+
+def _lookup(rows, items, position, fields):
+    """Заменяет в столбце ``position`` значения полей ``fields`` номерами
+    в таблице уникальных значений и возвращает таблицу."""
+    key_of = itemgetter(*fields)
+    empty = key_of(dict.fromkeys(fields))
+    index = {}
+    entries = []
+    for row, item in zip(rows, items):
+        key = key_of(item)
+        if key == empty:
+            row[position] = None
+            continue
+        number = index.get(key)
+        if number is None:
+            number = index[key] = len(entries)
+            values = key if len(fields) > 1 else (key,)
+            entries.append(dict(zip(fields, values)))
+        row[position] = number
+    return entries
+
+
+def columnar(body, key='results'):
+    """Переводит список объектов ``body[key]`` в колоночный вид."""
+    if key not in body:
+        return body
+    items = body[key]
+    columns = list(items[0]) if items else []
+    tables = []
+    for name, fields in LOOKUPS.items():
+        present = [field for field in fields if field in columns]
+        if present:
+            # Столбец таблицы называется по первому её полю,
+            # остальные её поля из строк уходят
+            tables.append((name, present))
+            columns = [
+                column for column in columns if column not in present[1:]]
+    result = {name: value for name, value in body.items() if name != key}
+    result['columns'] = columns
+    result['rows'] = rows = [
+        [*map(item.__getitem__, columns)] for item in items]
+    for name, fields in tables:
+        result[name] = _lookup(
+            rows, items, columns.index(fields[0]), fields)
+    return result
+
+
+def encode(name, body):
+    """Ответ в формате ``name`` байтами."""
+    if name == 'msgpack':
+        return msgpack.packb(columnar(body))
+    if name == 'columnar':
+        body = columnar(body)
+    # Кириллица без \uXXXX и без пробелов: ответ почти вдвое короче
+    return json.dumps(
+        body, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def render(request, body, status=200):
+    name = negotiate(request)
+    response = HttpResponse(
+        encode(name, body), content_type=formats()[name], status=status)
+    patch_vary_headers(response, ['Accept'])
+    return response
@@ -0,0 +1,98 @@
+"""Поля ответов API и выбор полей клиентом (sparse fieldsets).
+
+``?fields=id,text,author`` оставляет в постах только перечисленные поля.
+Из базы тогда читаются только столбцы и таблицы, которые нужны этим
+полям: без ``author`` и ``author_name`` запрос обходится без JOIN
+пользователей.
+"""
+from operator import attrgetter
+
+# Поле поста -> (столбцы, которые оно читает, значение в ответе)
+POST_FIELDS = {
+    'id': ((), attrgetter('id')),
+    'created': ((), lambda post: post.created.isoformat()),
+    'text': (('text',), attrgetter('text')),
+    'author': (('author__username',), attrgetter('author.username')),
+    'author_name': (
+        ('author__first_name', 'author__last_name'),
+        lambda post: post.author.get_full_name(),
+    ),
+    'group': (
+        ('group__slug',),
+        lambda post: post.group.slug if post.group_id else None,
+    ),
+    'image': (
+        ('image',), lambda post: post.image.url if post.image else None),
+    # Ссылка на готовое превью ленты, без построения в запросе
+    'thumbnail': (
+        ('image', 'thumbnail'), lambda post: post.thumbnail or None),
+    'comments_count': (('comments_count',), attrgetter('comments_count')),
+}
+# Ключ курсора читается всегда
+KEY_COLUMNS = ('id', 'created')
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def requested_fields(request):
+    """Поля постов из ``?fields=``, по умолчанию - все."""
+    raw = request.GET.get('fields', '')
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    if not fields:
+        return list(POST_FIELDS)
+    unknown = sorted(set(fields) - POST_FIELDS.keys())
+    if unknown:
+        raise FieldsError(f'Неизвестные поля: {", ".join(unknown)}')
+    return list(dict.fromkeys(fields))
+
+
+def load(queryset, fields, prefix='', extra=()):
+    """Ограничивает запрос столбцами выбранных полей.
+
+    ``prefix`` - путь до поста, если посты читаются через другую модель
+    (``post__`` для ленты подписок), ``extra`` - её собственные столбцы.
+    """
+    columns = [*extra, *(f'{prefix}{column}' for column in KEY_COLUMNS)]
+    for name in fields:
+        columns.extend(
+            f'{prefix}{column}' for column in POST_FIELDS[name][0])
+    related = {
+        column.rsplit('__', 1)[0] for column in columns if '__' in column
+    }
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def post(obj, fields):
+    return {name: POST_FIELDS[name][1](obj) for name in fields}
+
+
+def comment(obj):
+    return {
+        'id': obj.id,
+        'author': obj.author.username,
+        'text': obj.text,
+        'created': obj.created.isoformat(),
+    }
+
+
+def group(obj):
+    return {
+        'slug': obj.slug,
+        'title': obj.title,
+        'description': obj.description,
+        'posts_count': obj.posts_count,
+    }
+
+
+def author(obj, stats):
+    return {
+        'username': obj.username,
+        'name': obj.get_full_name(),
+        'posts_count': stats.posts_count,
+        'followers_count': stats.followers_count,
+        'following_count': stats.following_count,
+    }
@@ -0,0 +1,274 @@
+import json
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.query_budget import query_budget
+from api import renderers
+from posts.models import Comment, Follow, Group, Post
+from posts.views import COMMENTS_PER_PAGE, POSTS_PER_PAGE
+
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+        for i in range(POSTS_PER_PAGE + 3):
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group)
+        cls.post = Post.objects.order_by('pk').first()
+        Post.objects.filter(pk=cls.post.pk).update(
+            image='posts/small.gif', thumbnail='/media/cache/feed.jpg')
+        for i in range(COMMENTS_PER_PAGE + 2):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'comment{i}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(ApiTest.reader)
+
+    def get(self, url_name, kwargs=None, client=None, **params):
+        response = (client or self.guest).get(
+            reverse(url_name, kwargs=kwargs), params)
+        return response, json.loads(response.content)
+
+    def test_query_budget(self):
+        """Ответы API укладываются в бюджет запросов"""
+        pages = {
+            'api:index': {},
+            'api:group_posts': {'slug': 'test_slug'},
+            'api:profile': {'username': 'author'},
+            'api:post_detail': {'post_id': self.post.id},
+            'api:post_comments': {'post_id': self.post.id},
+        }
+        for url_name, kwargs in pages.items():
+            with self.subTest(url_name=url_name):
+                with query_budget(url_name):
+                    response = self.guest.get(reverse(url_name, kwargs=kwargs))
+                self.assertEqual(response.status_code, 200)
+        with query_budget('api:follow_index', authenticated=True):
+            response = self.reader_client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_feeds(self):
+        """Ленты отдают посты страницами по курсору"""
+        feeds = (
+            ('api:index', {}, self.guest),
+            ('api:group_posts', {'slug': 'test_slug'}, self.guest),
+            ('api:profile', {'username': 'author'}, self.guest),
+            ('api:follow_index', {}, self.reader_client),
+        )
+        for url_name, kwargs, client in feeds:
+            with self.subTest(url_name=url_name):
+                response, body = self.get(url_name, kwargs, client)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(len(body['results']), POSTS_PER_PAGE)
+                self.assertIsNone(body['previous_cursor'])
+                _, second = self.get(
+                    url_name, kwargs, client, cursor=body['next_cursor'])
+                posts = body['results'] + second['results']
+                ids = [post['id'] for post in posts]
+                self.assertEqual(
+                    ids, list(Post.objects.order_by('-created', '-id')
+                              .values_list('id', flat=True)))
+                self.assertIsNone(second['next_cursor'])
+
+    def test_post_fields(self):
+        """Пост с автором, группой и готовой ссылкой на превью"""
+        _, body = self.get(
+            'api:post_detail', {'post_id': self.post.id})
+        self.assertEqual(body['post'], {
+            'id': self.post.id,
+            'created': self.post.created.isoformat(),
+            'text': 'Пост 0',
+            'author': 'author',
+            'author_name': 'Лев Толстой',
+            'group': 'test_slug',
+            'image': '/media/posts/small.gif',
+            'thumbnail': '/media/cache/feed.jpg',
+            'comments_count': COMMENTS_PER_PAGE + 2,
+        })
+        self.assertEqual(len(body['comments']), COMMENTS_PER_PAGE)
+        _, rest = self.get(
+            'api:post_comments', {'post_id': self.post.id},
+            cursor=body['next_cursor'])
+        self.assertEqual(
+            [comment['text'] for comment in rest['results']],
+            [f'comment{i}'
+             for i in range(COMMENTS_PER_PAGE, COMMENTS_PER_PAGE + 2)])
+        self.assertIsNone(rest['next_cursor'])
+
+    def test_author_and_group(self):
+        """Профиль и группа отдают счётчики из таблиц статистики"""
+        _, body = self.get('api:profile', {'username': 'author'})
+        self.assertEqual(body['author'], {
+            'username': 'author',
+            'name': 'Лев Толстой',
+            'posts_count': POSTS_PER_PAGE + 3,
+            'followers_count': 1,
+            'following_count': 0,
+        })
+        _, body = self.get('api:group_posts', {'slug': 'test_slug'})
+        self.assertEqual(body['group']['posts_count'], POSTS_PER_PAGE + 3)
+
+    def test_sparse_fieldsets(self):
+        """?fields= сокращает и ответ, и запрос к базе"""
+        with CaptureQueriesContext(connection) as queries:
+            _, body = self.get('api:index', fields='id,text')
+        self.assertEqual(set(body['results'][0]), {'id', 'text'})
+        sql = queries[0]['sql']
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"thumbnail"', sql)
+        _, body = self.get(
+            'api:follow_index', client=self.reader_client, fields='author')
+        self.assertEqual(body['results'][0], {'author': 'author'})
+        response, body = self.get('api:index', fields='id,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', body['error'])
+
+    def test_errors(self):
+        """Ошибки - в JSON: 404, 401 для гостя в ленте подписок, 405"""
+        for url_name, kwargs in (
+                ('api:group_posts', {'slug': 'no_group'}),
+                ('api:profile', {'username': 'nobody'}),
+                ('api:post_detail', {'post_id': 10 ** 6}),
+                ('api:post_comments', {'post_id': 10 ** 6})):
+            with self.subTest(url_name=url_name):
+                response, body = self.get(url_name, kwargs)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('error', body)
+        response, _ = self.get('api:follow_index')
+        self.assertEqual(response.status_code, 401)
+        response = self.guest.post(reverse('api:index'))
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=60)
+    def test_cached(self):
+        """Ответ кешируется как JSON и сбрасывается новым постом"""
+        url = reverse('api:index')
+        self.guest.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest.get(url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        Post.objects.create(text='Свежий пост', author=self.author)
+        body = json.loads(self.guest.get(url).content)
+        self.assertEqual(body['results'][0]['text'], 'Свежий пост')
+
+
+class ApiFormatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+        for i in range(4):
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author,
+                group=cls.group if i % 2 else None)
+        Post.objects.create(text='Чужой пост', author=cls.other)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url_name, accept='*/*', **params):
+        return self.client.get(
+            reverse(url_name), params, HTTP_ACCEPT=accept)
+
+    def test_columnar(self):
+        """Колоночный JSON: авторы и группы по разу в таблицах"""
+        response = self.get(
+            'api:index', 'application/vnd.yatube.columnar+json')
+        self.assertEqual(
+            response['Content-Type'], 'application/vnd.yatube.columnar+json')
+        self.assertIn('Accept', response['Vary'])
+        body = json.loads(response.content)
+        self.assertNotIn('author_name', body['columns'])
+        self.assertEqual(body['authors'], [
+            {'author': 'other', 'author_name': ''},
+            {'author': 'author', 'author_name': 'Лев Толстой'},
+        ])
+        self.assertEqual(body['groups'], [{'group': 'test_slug'}])
+        author = body['columns'].index('author')
+        group = body['columns'].index('group')
+        self.assertEqual(
+            [row[author] for row in body['rows']], [0, 1, 1, 1, 1])
+        self.assertEqual(
+            [row[group] for row in body['rows']], [None, 0, None, 0, None])
+        # Те же данные, что и в обычном JSON
+        rows = json.loads(self.get('api:index').content)['results']
+        self.assertEqual(
+            [row[body['columns'].index('text')] for row in body['rows']],
+            [row['text'] for row in rows])
+
+    def test_negotiation(self):
+        """Формат по Accept с учётом q и по ?format=, иначе JSON"""
+        cases = (
+            ('application/json', {}, 'application/json'),
+            ('text/html,application/xhtml+xml', {}, 'application/json'),
+            ('application/json;q=0.5, '
+             'application/vnd.yatube.columnar+json',
+             {}, 'application/vnd.yatube.columnar+json'),
+            ('application/vnd.yatube.columnar+json;q=0', {},
+             'application/json'),
+            ('*/*', {'format': 'columnar'},
+             'application/vnd.yatube.columnar+json'),
+        )
+        for accept, params, content_type in cases:
+            with self.subTest(accept=accept, params=params):
+                response = self.get('api:index', accept, **params)
+                self.assertEqual(response['Content-Type'], content_type)
+
+    @skipUnless(renderers.msgpack, 'msgpack не установлен')
+    def test_msgpack(self):
+        """msgpack - тот же колоночный ответ"""
+        response = self.get('api:index', 'application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        columnar = json.loads(self.get('api:index', format='columnar').content)
+        self.assertEqual(
+            renderers.msgpack.unpackb(response.content), columnar)
+
+    def test_without_msgpack(self):
+        """Без пакета msgpack клиент получает JSON"""
+        with mock.patch.object(renderers, 'msgpack', None):
+            response = self.get('api:index', 'application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    @override_settings(PAGE_CACHE_TIMEOUT=60)
+    def test_cached_per_format(self):
+        """Каждый формат кешируется отдельно, ответ из кеша - с теми же
+        заголовками"""
+        columnar = 'application/vnd.yatube.columnar+json'
+        for accept in ('application/json', columnar) * 2:
+            with self.subTest(accept=accept):
+                response = self.get('api:index', accept)
+                self.assertEqual(response['Content-Type'], accept)
+                self.assertEqual(response['Vary'], 'Accept, Cookie')
+
+    def test_benchmark(self):
+        """Бенчмарк сравнивает все доступные форматы"""
+        out = StringIO()
+        call_command('api_benchmark', page_size=3, repeat=2, stdout=out)
+        for name in renderers.formats():
+            with self.subTest(name=name):
+                self.assertIn(name, out.getvalue())
@@ -0,0 +1,142 @@
+"""JSON API для мобильного клиента: те же ленты, что и HTML-страницы
+``posts.views``, без рендеринга шаблонов.
+
+Страницы листаются курсором ``?cursor=`` из ``next_cursor`` /
+``previous_cursor`` ответа, поля постов выбираются ``?fields=``.
+Формат ответа выбирается заголовком Accept (см. ``renderers``).
+Ответы кешируются и валидируются по тем же версиям, что и HTML-страницы,
+поэтому запись поста сбрасывает и их; каждый формат кешируется отдельно.
+"""
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_safe
+
+from core.paginator import get_page
+from posts import caching, counters, thumbnails, timeline
+from posts.models import Group, Post
+from posts.views import POSTS_PER_PAGE, comments_page
+
+from . import renderers, serializers
+
+User = get_user_model()
+
+
+def error_response(request, message, status):
+    return renderers.render(request, {'error': message}, status=status)
+
+
+def api_view(view):
+    """Только GET и HEAD, ошибки - в JSON, а не страницей."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return error_response(request, 'Не найдено', 404)
+        except serializers.FieldsError as error:
+            return error_response(request, str(error), 400)
+    return wrapper
+
+
+def posts_page(request, queryset):
+    fields = serializers.requested_fields(request)
+    page = get_page(
+        request, serializers.load(queryset, fields), POSTS_PER_PAGE)
+    return page_body(page, list(page), fields)
+
+
+def page_body(page, posts, fields):
+    if 'thumbnail' in fields:
+        thumbnails.attach(posts)
+    return {
+        'results': [serializers.post(post, fields) for post in posts],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+
+
+@caching.cached_page(
+    lambda request: [caching.FEED_VERSION_KEY], variant=renderers.negotiate)
+@api_view
+def index(request):
+    return renderers.render(
+        request, posts_page(request, Post.objects.all()))
+
+
+@caching.cached_page(
+    lambda request, slug: [caching.group_key(slug)],
+    variant=renderers.negotiate)
+@api_view
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return renderers.render(request, {
+        'group': serializers.group(group),
+        **posts_page(request, Post.objects.filter(group=group)),
+    })
+
+
+@caching.cached_page(
+    lambda request, username: [caching.author_key(username)],
+    variant=renderers.negotiate)
+@api_view
+def profile(request, username):
+    # Подписан ли читатель, в ответ не входит: он общий для всех
+    # и кешируется
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    return renderers.render(request, {
+        'author': serializers.author(author, counters.user_stats(author)),
+        **posts_page(request, Post.objects.filter(author_id=author.id)),
+    })
+
+
+@caching.cached_page(
+    lambda request, post_id: [
+        caching.post_key(post_id), caching.FEED_VERSION_KEY],
+    variant=renderers.negotiate)
+@api_view
+def post_detail(request, post_id):
+    fields = serializers.requested_fields(request)
+    post = get_object_or_404(
+        serializers.load(Post.objects.all(), fields), id=post_id)
+    if 'thumbnail' in fields:
+        thumbnails.attach([post])
+    comments = comments_page(request, post_id)
+    return renderers.render(request, {
+        'post': serializers.post(post, fields),
+        'comments': [serializers.comment(comment) for comment in comments],
+        'next_cursor': comments.next_cursor,
+    })
+
+
+@caching.conditional(
+    lambda request, post_id: [caching.post_key(post_id)],
+    variant=renderers.negotiate)
+@api_view
+def post_comments(request, post_id):
+    comments = comments_page(request, post_id)
+    if not comments and not Post.objects.filter(id=post_id).exists():
+        raise Http404
+    return renderers.render(request, {
+        'results': [serializers.comment(comment) for comment in comments],
+        'next_cursor': comments.next_cursor,
+    })
+
+
+@api_view
+def follow_index(request):
+    # Лента своя у каждого читателя и не кешируется
+    if not request.user.is_authenticated:
+        return error_response(request, 'Нужно войти', 401)
+    fields = serializers.requested_fields(request)
+    entries = serializers.load(
+        timeline.follow_feed(request.user).select_related(None), fields,
+        prefix='post__', extra=('created',))
+    page = get_page(
+        request, entries, POSTS_PER_PAGE, keys=('-created', '-post_id'))
+    return renderers.render(
+        request, page_body(page, [entry.post for entry in page], fields))
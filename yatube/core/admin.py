@@ -0,0 +1,13 @@
+from django.contrib import admin
+from .models import Task
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk', 'name', 'queue', 'status', 'attempts', 'run_at', 'locked_by')
+    list_filter = ('status', 'queue')
+    search_fields = ('name',)
+    empty_value_display = '-пусто-'
+
+
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,76 @@
+"""Кеш с защитой от «набега» (cache stampede).
+
+Когда дорогой фрагмент выпадает из кеша, его не должны пересчитывать
+одновременно все воркеры. ``get_or_build`` пересчитывает значение
+заранее, с вероятностью, растущей к концу срока жизни (XFetch), и только
+под блокировкой: остальные запросы в это время получают прежнее
+значение или недолго ждут, пока его соберёт владелец блокировки.
+"""
+import math
+import random
+import time
+
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache import cache as default_cache
+
+from core import db_router, metrics
+
+LOCK_TIMEOUT = 30
+WAIT_STEP = 0.05
+WAIT_STEPS = 20
+
+
+def fragments():
+    """Кеш для фрагментов и целых страниц: свой, если настроен."""
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def _fresh(expires_at, delta, beta):
+    # XFetch: чем дольше строится значение и чем ближе конец срока,
+    # тем вероятнее, что очередной запрос пересоберёт его заранее
+    return time.time() - delta * beta * math.log(random.random()) < expires_at
+
+
+def get_or_build(key, build, timeout, cache=None, beta=1.0, name=None):
+    """Отдаёт значение ``key`` из кеша, при необходимости вызывая ``build``.
+
+    ``timeout=None`` означает хранение без срока, как в самом кеше.
+    С ``name`` попадания и промахи считаются в метриках под этим именем.
+    """
+    cache = cache or default_cache
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+    if name:
+        if entry is None:
+            metrics.cache_miss(name)
+        else:
+            metrics.cache_hit(name)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if expires_at is None or _fresh(expires_at, delta, beta):
+            return value
+        if not cache.add(lock_key, True, LOCK_TIMEOUT):
+            # Значение уже пересобирает другой запрос
+            return value
+    elif not cache.add(lock_key, True, LOCK_TIMEOUT):
+        for _ in range(WAIT_STEPS):
+            time.sleep(WAIT_STEP)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        # Владелец блокировки не успел: собираем сами, без блокировки
+        return build()
+    try:
+        started = time.time()
+        # В кеш - только прочитанное из основной базы: реплика отстаёт
+        with db_router.pinned():
+            value = build()
+        delta = time.time() - started
+        expires_at = None if timeout is None else time.time() + timeout
+        cache.set(key, (value, expires_at, delta), timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
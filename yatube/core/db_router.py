@@ -0,0 +1,96 @@
+"""Чтение с реплик, запись в основную базу.
+
+``ReplicaRouter`` всегда пишет в ``default``. Читать с реплик из
+``DATABASE_REPLICAS`` можно только внутри ``replica_reads()``: реплика
+отстаёт от основной базы, и коду, который читает только что записанное
+(команды, воркер очереди, сигналы), нужна основная база.
+
+``ReplicaMiddleware`` включает чтение с реплик для безопасных запросов
+(GET, HEAD), кроме:
+
+* view под ``use_primary`` - они пишут, даже если это GET
+  (подписка на автора), и читают из основной базы;
+* запросов клиента, который писал меньше ``REPLICA_STICKY_SECONDS``
+  секунд назад: после записи ему ставится cookie, и автор сразу видит
+  свой пост и комментарий (read-your-writes).
+
+Страницы и фрагменты, которые собираются для общего кеша
+(``page_cache.cache_page``, ``cache.get_or_build``), тоже читают из
+основной базы: версии кеша поднимает запись, и копия с отставшей реплики
+пролежала бы под свежей версией до конца таймаута.
+
+Без реплик всё читается из ``default``.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_local = threading.local()
+
+
+@contextmanager
+def _state(**values):
+    previous = {name: getattr(_local, name, False) for name in values}
+    for name, value in values.items():
+        setattr(_local, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(_local, name, value)
+
+
+def replica_reads():
+    """Разрешает внутри блока читать с реплик."""
+    return _state(replica=True)
+
+
+def pinned():
+    """Читает внутри блока из основной базы, даже если реплики
+    разрешены снаружи."""
+    return _state(pinned=True)
+
+
+def reads_from_replica():
+    return (
+        getattr(_local, 'replica', False)
+        and not getattr(_local, 'pinned', False)
+    )
+
+
+def use_primary(view):
+    """View, которое пишет: читает из основной базы и включает
+    чтение с неё для следующих запросов клиента."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.db_written = True
+        with pinned():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not reads_from_replica():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы: объект с реплики можно
+        # связать с объектом из основной
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема приезжает на реплики репликацией
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,60 @@
+"""Хранилище метаданных превью sorl-thumbnail с пакетным чтением.
+
+Стандартное ``cached_db`` хранилище читает ключи по одному: каждый
+ключ - отдельный поход в кеш, а при промахе ещё и запрос к базе.
+``get_many`` достаёт ключи целой страницы ленты одним ``get_many``
+из общего кеша и одним запросом к базе для тех, что в кеше не нашлись.
+"""
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import metrics
+
+# Имя кеша превью в метриках
+METRICS_NAME = 'thumbnail_kvstore'
+
+
+class KVStore(CachedDBStore):
+    def _get_many_raw(self, keys):
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        metrics.cache_hit(METRICS_NAME, len(keys) - len(missing))
+        metrics.cache_miss(METRICS_NAME, len(missing))
+        if missing:
+            found = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list('key', 'value')
+            )
+            # Отсутствующие ключи тоже кешируются, как в _get_raw
+            self.cache.set_many(
+                {key: found.get(key, EMPTY_VALUE) for key in missing},
+                settings.THUMBNAIL_CACHE_TIMEOUT,
+            )
+            values.update(found)
+        return {
+            key: value
+            for key, value in values.items()
+            if value and value != EMPTY_VALUE
+        }
+
+    def _get_raw(self, key):
+        return self._get_many_raw([key]).get(key)
+
+    def get_many(self, image_files):
+        """Находит картинки в хранилище разом.
+
+        Возвращает словарь «ключ картинки -> ImageFile» только для
+        найденных картинок.
+        """
+        keys = {add_prefix(image_file.key): image_file.key
+                for image_file in image_files}
+        if not keys:
+            return {}
+        return {
+            keys[key]: deserialize_image_file(value)
+            for key, value in self._get_many_raw(list(keys)).items()
+        }
@@ -0,0 +1,13 @@
+"""Отправка писем через фоновую очередь ``email``."""
+from django.core.mail import EmailMultiAlternatives
+
+from .tasks import task
+
+
+@task(queue='email', max_attempts=5)
+def send_email(subject, body, from_email, recipients, html_body=None):
+    """Отправляет уже отрендеренное письмо."""
+    message = EmailMultiAlternatives(subject, body, from_email, recipients)
+    if html_body is not None:
+        message.attach_alternative(html_body, 'text/html')
+    message.send()
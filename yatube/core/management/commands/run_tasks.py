@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import tasks
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер фоновой очереди: выполняет задачи, повторяет упавшие '
+        'и соблюдает лимиты одновременных задач очередей'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            help='Очередь для обработки; можно указать несколько раз. '
+                 'По умолчанию - все очереди из TASK_QUEUES',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Выйти, когда готовых задач не останется',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Выйти после стольких задач',
+        )
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or list(settings.TASK_QUEUES)
+        worker = tasks.worker_name()
+        self.stdout.write(
+            f'Воркер {worker} слушает очереди: {", ".join(queues)}')
+        done, failed = tasks.work(
+            queues, burst=options['burst'], worker=worker,
+            limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {done}, упало: {failed}'))
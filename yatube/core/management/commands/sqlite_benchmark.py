@@ -0,0 +1,169 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.backends.sqlite3.base import apply_pragmas
+
+# Стандартный бэкенд Django: журнал отката, BEGIN DEFERRED, новое
+# соединение на каждый запрос; настроенный - как в DATABASES
+PROFILES = {
+    'stock': {'pragmas': {}, 'begin': 'BEGIN', 'persistent': False},
+    'tuned': {
+        'pragmas': settings.SQLITE_PRAGMAS,
+        'begin': 'BEGIN IMMEDIATE',
+        'persistent': True,
+    },
+}
+# Таймаут sqlite3.connect по умолчанию, как у Django
+CONNECT_TIMEOUT = 5.0
+
+SCHEMA = (
+    'CREATE TABLE post ('
+    'id INTEGER PRIMARY KEY, text TEXT, comments_count INTEGER)',
+    'CREATE TABLE comment ('
+    'id INTEGER PRIMARY KEY, post_id INTEGER, text TEXT)',
+    'CREATE INDEX comment_post ON comment (post_id)',
+)
+
+
+class Worker(threading.Thread):
+    def __init__(self, path, profile, deadline, operation, posts):
+        super().__init__(daemon=True)
+        self.path = path
+        self.profile = profile
+        self.deadline = deadline
+        self.operation = operation
+        self.posts = posts
+        self.done = 0
+        self.errors = 0
+        self.random = random.Random()
+
+    def connect(self):
+        connection = sqlite3.connect(
+            self.path, timeout=CONNECT_TIMEOUT, isolation_level=None,
+            check_same_thread=False)
+        apply_pragmas(connection, self.profile['pragmas'])
+        return connection
+
+    def run(self):
+        connection = None
+        while time.monotonic() < self.deadline:
+            if connection is None:
+                connection = self.connect()
+            try:
+                self.operation(self, connection)
+                self.done += 1
+            except sqlite3.OperationalError:
+                self.errors += 1
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+            if not self.profile['persistent']:
+                connection.close()
+                connection = None
+        if connection is not None:
+            connection.close()
+
+    def read(self, connection):
+        # Страница ленты и комментарии поста
+        offset = self.random.randrange(self.posts)
+        connection.execute(
+            'SELECT id, text, comments_count FROM post '
+            'ORDER BY id DESC LIMIT 10 OFFSET ?', [offset]).fetchall()
+        connection.execute(
+            'SELECT id, text FROM comment WHERE post_id = ? LIMIT 20',
+            [offset + 1]).fetchall()
+
+    def write(self, connection):
+        # Как add_comment: прочитать пост, вставить комментарий
+        # и поднять счётчик в одной транзакции
+        post_id = self.random.randrange(self.posts) + 1
+        connection.execute(self.profile['begin'])
+        connection.execute(
+            'SELECT comments_count FROM post WHERE id = ?', [post_id]
+        ).fetchone()
+        connection.execute(
+            'INSERT INTO comment (post_id, text) VALUES (?, ?)',
+            [post_id, 'comment'])
+        connection.execute(
+            'UPDATE post SET comments_count = comments_count + 1 '
+            'WHERE id = ?', [post_id])
+        connection.execute('COMMIT')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite при параллельных чтении '
+        'и записи со стандартными и настроенными параметрами соединения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5.0,
+            help='Длительность прогона каждого профиля, в секундах',
+        )
+        parser.add_argument('--posts', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for name, profile in PROFILES.items():
+                path = os.path.join(directory, f'{name}.sqlite3')
+                self.prepare(path, profile, options['posts'])
+                results[name] = self.run_profile(path, profile, options)
+        self.stdout.write(
+            f'{"профиль":<8}{"чтений/с":>12}{"записей/с":>12}'
+            f'{"ошибок":>10}')
+        for name, (reads, writes, errors) in results.items():
+            self.stdout.write(
+                f'{name:<8}{reads:>12.0f}{writes:>12.0f}{errors:>10}')
+        stock, tuned = results['stock'], results['tuned']
+        if stock[1]:
+            self.stdout.write(self.style.SUCCESS(
+                f'Записей в секунду: x{tuned[1] / stock[1]:.1f}, '
+                f'чтений: x{tuned[0] / max(stock[0], 1):.1f}'))
+
+    def prepare(self, path, profile, posts):
+        connection = sqlite3.connect(path, isolation_level=None)
+        # journal_mode=WAL хранится в самом файле базы
+        apply_pragmas(connection, profile['pragmas'])
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO post (text, comments_count) VALUES (?, 0)',
+            [(f'post {number}',) for number in range(posts)])
+        connection.execute('COMMIT')
+        connection.close()
+
+    def run_profile(self, path, profile, options):
+        deadline = time.monotonic() + options['duration']
+        workers = [
+            Worker(path, profile, deadline, Worker.read, options['posts'])
+            for _ in range(options['readers'])
+        ] + [
+            Worker(path, profile, deadline, Worker.write, options['posts'])
+            for _ in range(options['writers'])
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+        readers = workers[:options['readers']]
+        writers = workers[options['readers']:]
+        return (
+            sum(worker.done for worker in readers) / elapsed,
+            sum(worker.done for worker in writers) / elapsed,
+            sum(worker.errors for worker in workers),
+        )
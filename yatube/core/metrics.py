@@ -0,0 +1,329 @@
+"""Метрики запросов: время в SQL, шаблонах, кеше и построении превью.
+
+Пока идёт запрос, ``RequestMetricsMiddleware`` держит его
+``RequestMetrics`` в ``current()``: туда складывают числа обёртка
+выполнения SQL, бэкенд шаблонов, ``timed`` и ``cache_hit``/``cache_miss``.
+После ответа числа попадают в гистограммы ``registry`` с меткой имени
+URL (``posts:index``, ``posts:profile``, ...).
+
+У каждого воркера свой ``registry``. Если задан ``METRICS_DIR``, воркер
+раз в ``METRICS_FLUSH_INTERVAL`` секунд сбрасывает снимок своих метрик
+в файл ``<pid>.json``, а ``collect`` складывает снимки всех воркеров.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Гистограммы: имя -> границы корзин
+HISTOGRAMS = {
+    'request_seconds': DURATION_BUCKETS,
+    'db_queries': COUNT_BUCKETS,
+    'db_seconds': DURATION_BUCKETS,
+    'template_seconds': DURATION_BUCKETS,
+    # Время выполнения задач фоновой очереди, метка - имя задачи
+    'task_seconds': DURATION_BUCKETS,
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Последняя корзина - всё, что больше верхней границы
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Гистограммы, счётчики и датчики процесса, метки - кортеж пар."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = defaultdict(float)
+        self.gauges = defaultdict(float)
+        self.flushed = 0.0
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            key = (name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(HISTOGRAMS[name])
+            self.histograms[key].observe(value)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self.counters[(name, labels)] += value
+
+    def add_gauge(self, name, labels, delta):
+        with self._lock:
+            self.gauges[(name, labels)] += delta
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def snapshot(self):
+        """Метрики процесса в виде, пригодном для JSON."""
+        with self._lock:
+            return {
+                'histograms': [
+                    [name, labels, histogram.counts, histogram.sum]
+                    for (name, labels), histogram
+                    in self.histograms.items()
+                ],
+                'counters': [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'gauges': [
+                    [name, labels, value]
+                    for (name, labels), value in self.gauges.items()
+                ],
+            }
+
+    def flush(self, directory=None, force=False):
+        """Сбрасывает снимок в файл процесса, если пришло время."""
+        directory = directory or settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (
+                not force
+                and now - self.flushed < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.flushed = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        # Писатель один - сам процесс, но читатель не должен
+        # увидеть файл наполовину записанным
+        with open(f'{path}.tmp', 'w') as snapshot:
+            json.dump(self.snapshot(), snapshot)
+        os.replace(f'{path}.tmp', path)
+
+
+registry = Registry()
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.timings = defaultdict(float)
+        self.cache = defaultdict(lambda: {'hit': 0, 'miss': 0})
+        self._active = set()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Обёртка для ``connection.execute_wrapper``."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def current():
+    """Метрики текущего запроса или None вне запроса."""
+    return getattr(_local, 'metrics', None)
+
+
+def start():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def stop():
+    _local.metrics = None
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к ``name`` в метриках запроса.
+
+    Вложенные блоки с тем же именем не считаются дважды: include
+    внутри шаблона уже входит во время внешнего шаблона.
+    """
+    metrics = current()
+    if metrics is None or name in metrics._active:
+        yield
+        return
+    metrics._active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - started
+        metrics._active.discard(name)
+
+
+def _count_cache(name, result, value):
+    if not value:
+        return
+    labels = (('cache', name), ('result', result))
+    registry.inc('cache_requests', labels, value)
+    metrics = current()
+    if metrics is not None:
+        metrics.cache[name][result] += value
+
+
+def cache_hit(name, count=1):
+    _count_cache(name, 'hit', count)
+
+
+def cache_miss(name, count=1):
+    _count_cache(name, 'miss', count)
+
+
+# Функции, которые при сборе отдают общие для всех процессов датчики
+# (например, длину очереди в базе): [(имя, метки, значение), ...]
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+    return collector
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels(raw):
+    return tuple(tuple(pair) for pair in raw)
+
+
+def _read_snapshots(directory):
+    snapshots = {}
+    for name in os.listdir(directory):
+        pid, extension = os.path.splitext(name)
+        if extension != '.json' or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(directory, name)) as snapshot:
+                snapshots[int(pid)] = json.load(snapshot)
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots):
+    histograms = {}
+    counters = defaultdict(float)
+    gauges = defaultdict(float)
+    for pid, snapshot in snapshots.items():
+        for name, labels, counts, total in snapshot['histograms']:
+            key = (name, _labels(labels))
+            if key not in histograms:
+                histograms[key] = Histogram(HISTOGRAMS[name])
+            merged = histograms[key]
+            merged.counts = [a + b for a, b in zip(merged.counts, counts)]
+            merged.sum += total
+            merged.count += sum(counts)
+        for name, labels, value in snapshot['counters']:
+            counters[(name, _labels(labels))] += value
+        if pid == os.getpid() or _alive(pid):
+            for name, labels, value in snapshot['gauges']:
+                gauges[(name, _labels(labels))] += value
+    return histograms, counters, gauges
+
+
+def collect(directory=None):
+    """Метрики всех процессов, сложенные вместе.
+
+    Счётчики и гистограммы завершившихся процессов остаются в сумме,
+    как и положено накопительным метрикам; их датчики отбрасываются.
+    """
+    directory = directory or settings.METRICS_DIR
+    snapshots = {}
+    if directory:
+        registry.flush(directory, force=True)
+        snapshots = _read_snapshots(directory)
+    # Свой процесс - по живым данным, а не по файлу
+    snapshots[os.getpid()] = registry.snapshot()
+    histograms, counters, gauges = _merge(snapshots)
+    for collector in _collectors:
+        for name, labels, value in collector():
+            gauges[(name, labels)] += value
+    return histograms, counters, gauges
+
+
+def _format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(
+            key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def exposition(histograms, counters, gauges, prefix='yatube'):
+    """Текстовый формат Prometheus."""
+    lines = []
+    by_name = defaultdict(list)
+    for (name, labels), histogram in sorted(histograms.items()):
+        by_name[name].append((labels, histogram))
+    for name, series in by_name.items():
+        lines.append(f'# TYPE {prefix}_{name} histogram')
+        for labels, histogram in series:
+            cumulative = 0
+            bounds = [*map(str, histogram.buckets), '+Inf']
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{prefix}_{name}_bucket'
+                    f'{_format_labels(labels, le=bound)} {cumulative}')
+            lines.append(
+                f'{prefix}_{name}_sum{_format_labels(labels)} '
+                f'{histogram.sum}')
+            lines.append(
+                f'{prefix}_{name}_count{_format_labels(labels)} '
+                f'{histogram.count}')
+    for kind, values, suffix in (
+            ('counter', counters, '_total'), ('gauge', gauges, '')):
+        typed = set()
+        for (name, labels), value in sorted(values.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {prefix}_{name}{suffix} {kind}')
+            lines.append(
+                f'{prefix}_{name}{suffix}{_format_labels(labels)} '
+                f'{_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,112 @@
+import json
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core import db_router, metrics
+
+logger = logging.getLogger('core.requests')
+
+
+def _url_name(request):
+    match = request.resolver_match
+    if match is None:
+        return '<unresolved>'
+    return match.view_name
+
+
+def _server_timing(request_metrics, total):
+    entries = [
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={request_metrics.db_time * 1000:.1f};'
+        f'desc="{request_metrics.db_queries} queries"',
+    ]
+    for name, elapsed in sorted(request_metrics.timings.items()):
+        entries.append(f'{name};dur={elapsed * 1000:.1f}')
+    for name, results in sorted(request_metrics.cache.items()):
+        entries.append(
+            f'cache-{name};desc="hit {results["hit"]}, '
+            f'miss {results["miss"]}"')
+    return ', '.join(entries)
+
+
+class RequestMetricsMiddleware:
+    """Считает время запроса, SQL, шаблонов и обращения к кешу.
+
+    Отдаёт их в заголовке Server-Timing, пишет строкой JSON в лог
+    ``core.requests`` и копит гистограммы по имени URL.
+    Должна стоять первой в MIDDLEWARE, чтобы мерить весь запрос.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        request_metrics.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            metrics.stop()
+        total = request_metrics.elapsed
+        url_name = _url_name(request)
+        labels = (('view', url_name),)
+        metrics.registry.observe('request_seconds', labels, total)
+        metrics.registry.observe(
+            'db_queries', labels, request_metrics.db_queries)
+        metrics.registry.observe(
+            'db_seconds', labels, request_metrics.db_time)
+        metrics.registry.observe(
+            'template_seconds', labels,
+            request_metrics.timings.get('template', 0.0))
+        metrics.registry.flush()
+        response['Server-Timing'] = _server_timing(request_metrics, total)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': url_name,
+            'status': response.status_code,
+            'duration_ms': round(total * 1000, 1),
+            'db_queries': request_metrics.db_queries,
+            'db_ms': round(request_metrics.db_time * 1000, 1),
+            'timings_ms': {
+                name: round(elapsed * 1000, 1)
+                for name, elapsed in request_metrics.timings.items()
+            },
+            'cache': request_metrics.cache,
+        }, ensure_ascii=False))
+        return response
+
+
+class ReplicaMiddleware:
+    """Разрешает безопасным запросам читать с реплик, а после записи
+    ставит клиенту cookie, чтобы он какое-то время читал из основной
+    базы (read-your-writes)."""
+
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in self.SAFE_METHODS
+        if safe and settings.REPLICA_STICKY_COOKIE not in request.COOKIES:
+            with db_router.replica_reads():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        written = not safe or getattr(request, 'db_written', False)
+        if written and response.status_code < 400:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class CreatedModel(models.Model):
@@ -11,3 +12,44 @@ class CreatedModel(models.Model):
     class Meta:
         # Это абстрактная модель:
         abstract = True
+
+
+class Task(CreatedModel):
+    """Задача фоновой очереди, см. ``core.tasks``."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=255)
+    queue = models.CharField('Очередь', max_length=50, default='default')
+    # Аргументы в JSON: {"args": [...], "kwargs": {...}}
+    payload = models.TextField('Аргументы')
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Всего попыток', default=3)
+    run_at = models.DateTimeField('Выполнить после', default=timezone.now)
+    locked_by = models.CharField('Воркер', max_length=100, blank=True)
+    locked_at = models.DateTimeField('Взята в работу', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ('run_at', 'id')
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+        # Воркер выбирает готовые задачи своих очередей по времени
+        indexes = [
+            models.Index(fields=['status', 'queue', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
@@ -0,0 +1,161 @@
+"""Кеш целых страниц с «дырками» под данные пользователя.
+
+Страница рендерится один раз и кешируется для всех - гостей и вошедших
+пользователей. Части, которые зависят от пользователя (шапка, кнопки,
+форма комментария), выводятся тегом ``{% hole %}``: при рендеринге в кеш
+на их месте остаётся метка, а перед ответом каждая метка заменяется
+шаблоном дырки, отрендеренным для текущего запроса.
+
+Дырка регистрируется декоратором ``register_hole`` над функцией, которая
+по запросу и параметрам из метки досчитывает контекст шаблона дырки.
+Текст пользователей экранируется шаблонами, поэтому подделать метку
+через содержимое поста нельзя.
+"""
+import base64
+import hashlib
+import json
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from core import db_router, metrics
+from core.cache import fragments
+
+HOLE = re.compile(r'<!--hole:([\w=-]+)-->')
+# Параметры запроса, которые читают кешируемые страницы. Остальные
+# (utm-метки, случайные параметры против кеша) в ключ не входят и не
+# плодят копий одной страницы
+KEY_PARAMS = ('cursor', 'fields', 'format', 'page', 'q')
+
+_holes = {}
+
+
+def register_hole(name, template_name):
+    """Регистрирует дырку ``name`` с шаблоном ``template_name``."""
+    def decorator(build_context):
+        _holes[name] = (template_name, build_context)
+        return build_context
+    return decorator
+
+
+def hole_template(name):
+    return _holes[name][0]
+
+
+def punching(request):
+    """Рендерится ли сейчас страница для кеша, с метками вместо дырок."""
+    return getattr(request, '_punch_holes', False)
+
+
+def placeholder(name, params):
+    raw = json.dumps([name, params])
+    token = base64.urlsafe_b64encode(raw.encode()).decode()
+    return f'<!--hole:{token}-->'
+
+
+def render_hole(request, name, params):
+    template_name, build_context = _holes[name]
+    context = {**params, **build_context(request, **params)}
+    return render_to_string(template_name, context, request=request)
+
+
+def fill_holes(request, content):
+    """Заменяет метки дырок их шаблонами для текущего запроса."""
+    def fill(match):
+        name, params = json.loads(base64.urlsafe_b64decode(match.group(1)))
+        return render_hole(request, name, params)
+    return HOLE.sub(fill, content)
+
+
+def _filled(request, content_type, content):
+    # Дырки бывают только в HTML: в JSON текст пользователя не
+    # экранируется шаблоном, и метку в нём можно было бы подделать
+    if not content_type.startswith('text/html'):
+        return content
+    return fill_holes(request, content)
+
+
+def _page_key(request, versions, variant):
+    # Значение параметра - последнее в запросе, как его видит view
+    params = urlencode([
+        (name, request.GET[name])
+        for name in KEY_PARAMS if name in request.GET
+    ])
+    path = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+    if variant is not None:
+        path = f'{path}:{variant(request)}'
+    page_versions = ':'.join(str(version) for version in versions)
+    return f'page:{path}:{page_versions}'
+
+
+def _cached_response(request, cached):
+    headers, content = cached
+    response = HttpResponse(
+        _filled(request, headers['Content-Type'], content))
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def cache_page(versions, variant=None):
+    """Кеширует страницу по адресу и версиям её содержимого.
+
+    Адрес в ключе - путь и параметры из ``KEY_PARAMS`` в постоянном
+    порядке. ``versions(request, *args, **kwargs)`` возвращает версии
+    данных страницы: после записи ключ меняется, и страница рендерится
+    заново.
+    ``variant(request)`` - представление страницы по тому же адресу,
+    например выбранный по заголовку Accept формат ответа.
+    Ответ хранится вместе с заголовками view - типом содержимого и
+    Vary, - так что из кеша отдаётся тот же ответ, что и без него,
+    в том числе ответ API в JSON или в двоичном формате.
+    ``PAGE_CACHE_TIMEOUT = 0`` выключает кеш.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = settings.PAGE_CACHE_TIMEOUT
+            if not timeout or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = _page_key(
+                request, versions(request, *args, **kwargs), variant)
+            page_cache = fragments()
+            cached = page_cache.get(key)
+            if cached is not None:
+                metrics.cache_hit('page')
+                return _cached_response(request, cached)
+            metrics.cache_miss('page')
+            request._punch_holes = True
+            try:
+                # Страница ляжет в общий кеш под свежими версиями, а
+                # реплика может ещё не видеть записи, которая их подняла
+                with db_router.pinned():
+                    response = view(request, *args, **kwargs)
+            finally:
+                # Страницы ошибок рендерятся уже после view, целиком
+                request._punch_holes = False
+            if response.streaming:
+                return response
+            content_type = response['Content-Type']
+            content = response.content
+            if content_type.startswith('text/html'):
+                content = content.decode(response.charset)
+            if response.status_code == 200:
+                # Длину ответ считает сам, по заполненным дыркам
+                headers = {
+                    name: value for name, value in response.items()
+                    if name.lower() != 'content-length'}
+                page_cache.set(key, (headers, content), timeout)
+            response.content = _filled(request, content_type, content)
+            return response
+        return wrapper
+    return decorator
+
+
+@register_hole('header', 'includes/header.html')
+def header_context(request, query=''):
+    return {}
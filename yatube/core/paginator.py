@@ -0,0 +1,186 @@
+import base64
+import binascii
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+
+NEXT = 'next'
+PREVIOUS = 'prev'
+# Старые ссылки ?page=N глубже не заходят; дальше OFFSET переполнил бы
+# целое SQLite, а страница всё равно пуста
+MAX_PAGE = 10000
+
+
+def _key_value(value):
+    # DjangoJSONEncoder обрезает время до миллисекунд, а курсору
+    # нужны точные значения, иначе на границе страниц теряются записи.
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключа в непрозрачную строку."""
+    raw = json.dumps([direction, [_key_value(value) for value in values]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор. Возвращает None, если курсор испорчен."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list):
+        return None
+    if not all(map(_scalar, values)):
+        return None
+    return direction, values
+
+
+def _scalar(value):
+    # В курсоре только значения ключа: строки и числа, которые влезают
+    # в столбец базы; null, списки и объекты - признак подделки
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return -2 ** 63 <= value < 2 ** 63
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return isinstance(value, str)
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинатор: страница отбирается по значениям ключа
+    (по умолчанию ``(created, id)``) последней показанной записи.
+
+    В отличие от ``Paginator`` не делает ни ``COUNT(*)``, ни ``OFFSET``,
+    поэтому любая страница стоит столько же, сколько первая.
+    Ссылки на соседние страницы лежат в ``page.next_cursor``
+    и ``page.previous_cursor``.
+    """
+
+    def __init__(self, object_list, per_page, keys=('-created', '-id'),
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.keys = keys
+
+    def get_cursor_page(self, cursor=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        values = self._parse_values(decoded[1]) if decoded else None
+        if values is None:
+            return self._forward_page(None)
+        if decoded[0] == PREVIOUS:
+            return self._backward_page(values)
+        return self._forward_page(values)
+
+    def get_offset_page(self, number):
+        """Страница по номеру для старых ссылок ``?page=N``.
+
+        Использует ``OFFSET``, но, как и курсорные страницы, обходится
+        без ``COUNT(*)`` и отдаёт курсоры на соседние страницы.
+        """
+        try:
+            number = min(max(int(number), 1), MAX_PAGE)
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = list(self._ordered()[offset:offset + self.per_page + 1])
+        return self._build_page(
+            rows, number, has_next=len(rows) > self.per_page,
+            has_previous=number > 1)
+
+    def _ordered(self):
+        return self.object_list.order_by(*self.keys)
+
+    def _parse_values(self, raw_values):
+        if len(raw_values) != len(self.keys):
+            return None
+        try:
+            return [
+                self._field(key.lstrip('-')).to_python(value)
+                for key, value in zip(self.keys, raw_values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            return None
+
+    def _field(self, name):
+        # Ключом может быть и аннотация, например ранг поиска
+        annotations = self.object_list.query.annotations
+        if name in annotations:
+            return annotations[name].output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def _after(self, values, reverse=False):
+        """Условие «строго после ``values``» в порядке ``self.keys``.
+
+        ``a < x OR (a = x AND b < y)`` дополняется избыточным ``a <= x``:
+        без него SQLite не видит границы диапазона по первому ключу
+        и перебирает индекс с начала (или объединяет OR по двум индексам
+        с сортировкой во временном B-дереве), и глубокие страницы
+        становятся тем дороже, чем дальше от начала.
+        """
+        first = self.keys[0]
+        bound = 'lte' if first.startswith('-') != reverse else 'gte'
+        condition = Q()
+        for position, key in enumerate(self.keys):
+            name = key.lstrip('-')
+            descending = key.startswith('-') != reverse
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            step = Q(**{lookup: values[position]})
+            for previous_key, value in zip(self.keys[:position], values):
+                step &= Q(**{previous_key.lstrip('-'): value})
+            condition |= step
+        return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+    def _forward_page(self, values):
+        queryset = self._ordered()
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+        rows = list(queryset[:self.per_page + 1])
+        return self._build_page(
+            rows, 1, has_next=len(rows) > self.per_page,
+            has_previous=values is not None)
+
+    def _backward_page(self, values):
+        reversed_keys = [
+            key[1:] if key.startswith('-') else f'-{key}' for key in self.keys
+        ]
+        queryset = self.object_list.order_by(*reversed_keys).filter(
+            self._after(values, reverse=True))
+        rows = list(queryset[:self.per_page + 1])
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: отдаём обычную первую страницу,
+            # чтобы она не оказалась короче остальных.
+            return self._forward_page(None)
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return self._build_page(rows, 1, has_next=True, has_previous=True)
+
+    def _build_page(self, rows, number, has_next, has_previous):
+        rows = rows[:self.per_page]
+        page = Page(rows, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if rows and has_next:
+            page.next_cursor = encode_cursor(NEXT, self._key_of(rows[-1]))
+        if rows and has_previous:
+            page.previous_cursor = encode_cursor(
+                PREVIOUS, self._key_of(rows[0]))
+        return page
+
+    def _key_of(self, obj):
+        return [getattr(obj, key.lstrip('-')) for key in self.keys]
+
+
+def get_page(request, queryset, per_page, keys=('-created', '-id')):
+    """Отдаёт страницу ленты по ``?cursor=`` (или старому ``?page=``)."""
+    paginator = CursorPaginator(queryset, per_page, keys=keys)
+    page_number = request.GET.get('page')
+    if page_number and not request.GET.get('cursor'):
+        return paginator.get_offset_page(page_number)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
@@ -0,0 +1,114 @@
+"""Бюджеты запросов к базе для страниц проекта.
+
+Бюджет - сколько запросов страница делает при любом числе постов,
+комментариев и подписок на ней. Все бюджеты собраны в ``QUERY_BUDGETS``
+по имени URL и методу; тесты проверяют их через ``query_budget``::
+
+    with query_budget('posts:index'):
+        client.get(reverse('posts:index'))
+
+    @query_budget('posts:follow_index', authenticated=True)
+    def test_follow_index(self):
+        ...
+
+Бюджет указан для гостя: вошедший пользователь добавляет
+``SESSION_QUERIES`` запросов на сессию и себя. Запрос сверх бюджета -
+почти всегда N+1 в шаблоне или новый запрос в сигнале, поэтому бюджет
+поднимают осознанно, вместе с правкой, которая его тратит.
+"""
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+# Сессия и пользователь у вошедшего клиента
+SESSION_QUERIES = 2
+
+QUERY_BUDGETS = {
+    # Ленты: посты с авторами и группами, превью из общего кеша
+    'posts:index': {'GET': 1},
+    'posts:current_post': {'GET': 2},
+    'posts:group_list': {'GET': 1},
+    'posts:post_search': {'GET': 1},
+    # Вошедшему читателю ещё запрос на кнопку подписки
+    'posts:profile': {'GET': 3},
+    # Лента подписок ищет популярных авторов для догрузки
+    'posts:follow_index': {'GET': 2},
+    'posts:post_detail': {'GET': 2},
+    'posts:post_comments': {'GET': 1},
+    # Выгрузка: запрос на каждые export.BATCH_SIZE строк; бюджет - для
+    # таблицы в одну пачку, вошедший сотрудник добавляет сессию
+    'posts:export_data': {'GET': 1},
+    # Форма поста выбирает из списка групп
+    # Раскладка по лентам перечитывает пост: в очереди он мог исчезнуть
+    'posts:post_create': {'GET': 1, 'POST': 13},
+    'posts:post_edit': {'GET': 2, 'POST': 12},
+    'posts:add_comment': {'POST': 5},
+    'posts:profile_follow': {'GET': 9},
+    'posts:profile_unfollow': {'GET': 9},
+    # API читает то же, что и HTML-страницы
+    'api:index': {'GET': 1},
+    'api:group_posts': {'GET': 2},
+    'api:profile': {'GET': 2},
+    'api:post_detail': {'GET': 2},
+    'api:post_comments': {'GET': 1},
+    'api:follow_index': {'GET': 2},
+    'users:signup': {'GET': 0, 'POST': 6},
+    # Вход пишет сессию и last_login, каждую запись в своей точке сохранения
+    'users:login': {'GET': 0, 'POST': 9},
+    'users:logout': {'GET': 2},
+    # Сохранение пользователя сверяет имя, чтобы не сбрасывать кеш зря
+    'users:password_change': {'GET': 0, 'POST': 11},
+    'users:password_change_done': {'GET': 0},
+    # Токен сброса выписывает воркер и заново читает пользователя
+    'users:password_reset_email': {'GET': 0, 'POST': 2},
+    'users:password_reset_done': {'GET': 0},
+    'users:password_reset_confirm': {'GET': 1},
+    'users:password_reset_complete': {'GET': 0},
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def budget(url_name, method='GET'):
+    """Бюджет страницы для гостя."""
+    try:
+        return QUERY_BUDGETS[url_name][method]
+    except KeyError:
+        raise LookupError(
+            f'Для {method} {url_name} не задан бюджет запросов')
+
+
+class query_budget(ContextDecorator):
+    """Проверяет, что блок уложился в бюджет страницы ``url_name``."""
+
+    def __init__(self, url_name, method='GET', authenticated=False,
+                 using=DEFAULT_DB_ALIAS):
+        self.url_name = url_name
+        self.method = method
+        self.allowed = budget(url_name, method)
+        if authenticated:
+            self.allowed += SESSION_QUERIES
+        self.using = using
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        executed = len(self.context)
+        if executed > self.allowed:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(self.context, start=1)
+            )
+            raise QueryBudgetExceeded(
+                f'{self.method} {self.url_name}: {executed} запросов '
+                f'при бюджете {self.allowed}\n{queries}')
+        return False
@@ -0,0 +1,232 @@
+"""Фоновая очередь задач в базе проекта.
+
+Медленные побочные эффекты (письма, превью, раскладка лент) не
+выполняются в запросе: view или сигнал ставит задачу в очередь, а
+воркер ``manage.py run_tasks`` выполняет её отдельно::
+
+    @task(queue='email')
+    def send_email(subject, body, from_email, recipients):
+        ...
+
+    send_email.delay(subject, body, from_email, [to_email])
+
+Задача - строка ``core.Task``, которая пишется в той же транзакции,
+что и данные запроса: после отката задачи нет, а воркер видит её только
+после коммита. Аргументы должны укладываться в JSON.
+
+Упавшая задача повторяется с растущей паузой, пока не кончатся попытки,
+и остаётся в базе со статусом ``failed``. ``TASK_QUEUES`` ограничивает
+число одновременно выполняемых задач каждой очереди на всех воркерах.
+Аргументы задачи с ``sensitive=True`` после последней попытки стираются
+из базы. С ``TASKS_ALWAYS_EAGER`` задачи выполняются сразу при постановке,
+без базы и воркера.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE = 'default'
+# Аргументы упавшей задачи с sensitive=True
+REDACTED_PAYLOAD = json.dumps({'redacted': True})
+
+
+class TaskFunction:
+    """Функция, которую можно выполнить сейчас или поставить в очередь."""
+
+    def __init__(self, func, queue, max_attempts, sensitive=False):
+        self.func = func
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.sensitive = sensitive
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return enqueue(self, args, kwargs)
+
+
+def task(queue=DEFAULT_QUEUE, max_attempts=3, sensitive=False):
+    """Делает из функции задачу очереди ``queue``."""
+    def decorator(func):
+        return TaskFunction(func, queue, max_attempts, sensitive)
+    return decorator
+
+
+def enqueue(task_function, args=(), kwargs=None, delay=0):
+    """Ставит задачу в очередь, с ``delay`` - не раньше чем через
+    столько секунд."""
+    kwargs = kwargs or {}
+    if settings.TASKS_ALWAYS_EAGER:
+        _run_eager(task_function, args, kwargs)
+        return None
+    return Task.objects.create(
+        name=task_function.name,
+        queue=task_function.queue,
+        payload=json.dumps({'args': list(args), 'kwargs': kwargs}),
+        max_attempts=task_function.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _run_eager(task_function, args, kwargs):
+    # Аргументы проходят через JSON, как и в очереди: задача, которая
+    # работает только в режиме отладки, не должна попасть в прод
+    payload = json.loads(json.dumps({'args': list(args), 'kwargs': kwargs}))
+    try:
+        task_function(*payload['args'], **payload['kwargs'])
+    except Exception:
+        logger.exception('Задача %s упала', task_function.name)
+
+
+def concurrency(queue):
+    return settings.TASK_QUEUES.get(queue, 1)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def recover_stale():
+    """Возвращает в очередь задачи, воркер которых пропал."""
+    deadline = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return Task.objects.filter(
+        status=Task.RUNNING, locked_at__lt=deadline
+    ).update(status=Task.QUEUED, locked_by='', locked_at=None)
+
+
+def claim(queues, worker):
+    """Берёт в работу готовую задачу из очередей, где есть место.
+
+    Задача забирается условным UPDATE: если её уже взял другой воркер,
+    строка не обновится, и берётся следующая.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        running = dict(
+            Task.objects.filter(status=Task.RUNNING, queue__in=queues)
+            .values('queue')
+            .annotate(total=Count('id'))
+            .values_list('queue', 'total')
+        )
+        free = [
+            queue for queue in queues
+            if running.get(queue, 0) < concurrency(queue)
+        ]
+        if not free:
+            return None
+        candidates = Task.objects.filter(
+            status=Task.QUEUED, queue__in=free, run_at__lte=now
+        ).values_list('pk', flat=True)[:10]
+        for pk in candidates:
+            taken = Task.objects.filter(pk=pk, status=Task.QUEUED).update(
+                status=Task.RUNNING,
+                locked_by=worker,
+                locked_at=now,
+                attempts=F('attempts') + 1,
+            )
+            if taken:
+                return Task.objects.get(pk=pk)
+    return None
+
+
+def retry_delay(attempt):
+    """Пауза перед повтором: 1, 2, 4, ... ``TASK_RETRY_DELAY``."""
+    return settings.TASK_RETRY_DELAY * 2 ** (attempt - 1)
+
+
+def execute(task_row):
+    """Выполняет взятую задачу. Успешная задача удаляется из базы."""
+    started = time.perf_counter()
+    task_function = None
+    try:
+        payload = json.loads(task_row.payload)
+        task_function = import_string(task_row.name)
+        task_function(*payload['args'], **payload['kwargs'])
+    except Exception:
+        logger.exception('Задача %s упала', task_row.name)
+        _fail(
+            task_row, traceback.format_exc(),
+            sensitive=getattr(task_function, 'sensitive', False))
+        return False
+    finally:
+        metrics.registry.observe(
+            'task_seconds', (('task', task_row.name),),
+            time.perf_counter() - started)
+    task_row.delete()
+    return True
+
+
+def _fail(task_row, error, sensitive=False):
+    task_row.last_error = error
+    task_row.locked_by = ''
+    task_row.locked_at = None
+    if task_row.attempts < task_row.max_attempts:
+        task_row.status = Task.QUEUED
+        task_row.run_at = timezone.now() + timedelta(
+            seconds=retry_delay(task_row.attempts))
+    else:
+        task_row.status = Task.FAILED
+        if sensitive:
+            # Повторов больше не будет, а для разбора хватит ошибки
+            task_row.payload = REDACTED_PAYLOAD
+    task_row.save(update_fields=[
+        'last_error', 'locked_by', 'locked_at', 'status', 'run_at',
+        'payload'])
+
+
+def work(queues, burst=False, worker=None, limit=None):
+    """Цикл воркера. С ``burst`` выходит, когда готовых задач не осталось.
+
+    Возвращает пару «выполнено, упало».
+    """
+    worker = worker or worker_name()
+    done = failed = 0
+    while limit is None or done + failed < limit:
+        recover_stale()
+        task_row = claim(queues, worker)
+        if task_row is None:
+            metrics.registry.flush()
+            if burst:
+                break
+            time.sleep(settings.TASK_POLL_INTERVAL)
+            continue
+        if execute(task_row):
+            done += 1
+        else:
+            failed += 1
+        metrics.registry.flush()
+    return done, failed
+
+
+@metrics.register_collector
+def queue_depth():
+    """Длина очередей и число выполняемых задач для /metrics/."""
+    rows = (
+        Task.objects.exclude(status=Task.FAILED)
+        .values('queue', 'status')
+        .annotate(total=Count('id'))
+        .values_list('queue', 'status', 'total')
+    )
+    names = {Task.QUEUED: 'queue_depth', Task.RUNNING: 'tasks_running'}
+    return [
+        (names[status], (('queue', queue),), total)
+        for queue, status, total in rows
+    ]
@@ -0,0 +1,23 @@
+from django.template.backends.django import DjangoTemplates, Template
+
+from core import metrics
+
+
+class TimedTemplate(Template):
+    """Шаблон, время рендеринга которого попадает в метрики запроса."""
+
+    def render(self, context=None, request=None):
+        with metrics.timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, которые мерят время рендеринга шаблонов."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self)
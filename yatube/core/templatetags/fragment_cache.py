@@ -0,0 +1,50 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core.cache import fragments, get_or_build
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, expire_time, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.expire_time = expire_time
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        expire_time = self.expire_time.resolve(context)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return get_or_build(
+            key,
+            lambda: self.nodelist.render(context),
+            expire_time,
+            cache=fragments(),
+            name=self.fragment_name,
+        )
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """Как ``{% cache %}``, но с защитой от одновременного пересчёта.
+
+    {% fragment_cache [expire_time] [fragment_name] [var1] .. %}
+        .. дорогой фрагмент ..
+    {% endfragment_cache %}
+    """
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 2 arguments.')
+    return FragmentCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]],
+    )
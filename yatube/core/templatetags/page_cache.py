@@ -0,0 +1,46 @@
+from django import template
+from django.template.base import token_kwargs
+
+from core.page_cache import hole_template, placeholder, punching
+
+register = template.Library()
+
+
+class HoleNode(template.Node):
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        params = {
+            key: value.resolve(context) for key, value in self.params.items()
+        }
+        request = context.get('request')
+        if request is not None and punching(request):
+            return placeholder(name, params)
+        # Без кеша страницы дырка - обычный include с параметрами
+        hole = context.template.engine.get_template(hole_template(name))
+        with context.push(**params):
+            return hole.render(context)
+
+
+@register.tag
+def hole(parser, token):
+    """Часть страницы, которая рендерится для каждого пользователя.
+
+    {% hole 'name' [key=value ..] %}
+
+    Параметры попадают в метку дырки в кешированной странице, поэтому
+    должны быть простыми значениями: строками и числами.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]!r} tag requires a hole name.')
+    remaining = bits[2:]
+    params = token_kwargs(remaining, parser)
+    if remaining:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]!r} tag accepts only key=value arguments.')
+    return HoleNode(parser.compile_filter(bits[1]), params)
@@ -1,5 +1,32 @@
-from django.test import TestCase
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotFound
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 from http import HTTPStatus
+from io import StringIO
+
+from core import db_router, metrics, page_cache, tasks
+from core.backends.sqlite3.base import DatabaseWrapper, apply_pragmas
+from core.cache import fragments, get_or_build
+from core.middleware import ReplicaMiddleware
+from core.models import Task
+from posts.models import Post
 
 
 class ViewTestClass(TestCase):
@@ -14,3 +41,415 @@ class ViewTestClass(TestCase):
         """Проверка шаблона на 404"""
         response = self.client.get('/nonexist-page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class StampedeCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Два экземпляра над одним каталогом - как два воркера gunicorn
+        self.first_worker = FileBasedCache(self.directory, {})
+        self.second_worker = FileBasedCache(self.directory, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_shared_between_workers(self):
+        """Значение, собранное одним воркером, видит другой"""
+        calls = []
+
+        def build():
+            calls.append(1)
+            return 'fragment'
+
+        get_or_build('key', build, 60, cache=self.first_worker)
+        value = get_or_build('key', build, 60, cache=self.second_worker)
+        self.assertEqual(value, 'fragment')
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_while_locked(self):
+        """Пока значение пересобирает другой воркер, отдаётся прежнее"""
+        get_or_build('key', lambda: 'old', 60, cache=self.first_worker)
+        self.first_worker.set('key', ('old', time.time() - 1, 0), 60)
+        self.first_worker.add('key:lock', True, 30)
+        value = get_or_build(
+            'key', lambda: 'new', 60, cache=self.second_worker)
+        self.assertEqual(value, 'old')
+
+    def test_early_recompute(self):
+        """Просроченное значение пересобирается одним запросом"""
+        self.first_worker.set('key', ('old', time.time() - 1, 0), 60)
+        value = get_or_build(
+            'key', lambda: 'new', 60, cache=self.second_worker)
+        self.assertEqual(value, 'new')
+        self.assertIsNone(self.first_worker.get('key:lock'))
+        self.assertEqual(self.first_worker.get('key')[0], 'new')
+
+
+class CacheSettingsTest(TestCase):
+    def test_fragments_cache(self):
+        """Страницы и фрагменты лежат в своём кеше и не вытесняют версии"""
+        self.assertIsNot(fragments(), caches['default'])
+        for alias in ('default', 'template_fragments'):
+            with self.subTest(alias=alias):
+                self.assertEqual(
+                    caches[alias]._max_entries,
+                    settings.CACHE_MAX_ENTRIES[alias])
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        user = get_user_model().objects.create_user(username='test_user')
+        Post.objects.create(text='test_text', author=user)
+
+    def test_server_timing(self):
+        """Ответ несёт время запроса, SQL, шаблонов и обращения к кешу"""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for entry in ('total;dur=', 'db;dur=', 'template;dur=',
+                      'cache-index_page;desc="hit 0, miss 1"'):
+            with self.subTest(entry=entry):
+                self.assertIn(entry, timing)
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn(
+            'cache-index_page;desc="hit 1, miss 0"',
+            response['Server-Timing'])
+
+    def test_histograms_by_url_name(self):
+        """Гистограммы копятся по имени URL"""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get('/nonexist-page/')
+        labels = (('view', 'posts:index'),)
+        histogram = metrics.registry.histograms[('request_seconds', labels)]
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(sum(histogram.counts), 2)
+        queries = metrics.registry.histograms[('db_queries', labels)]
+        self.assertGreater(queries.sum, 0)
+        self.assertIn(
+            ('request_seconds', (('view', '<unresolved>'),)),
+            metrics.registry.histograms)
+
+    def test_structured_log(self):
+        """Каждый запрос пишется в лог одной строкой JSON"""
+        with self.assertLogs('core.requests', 'INFO') as logs:
+            self.client.get(reverse('posts:index'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_queries'], 0)
+        self.assertIn('template', record['timings_ms'])
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_snapshot(self, pid, snapshot):
+        path = os.path.join(self.directory, f'{pid}.json')
+        with open(path, 'w') as output:
+            json.dump(snapshot, output)
+
+    def test_internal_only(self):
+        """Метрики не видны с чужих адресов"""
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        """С токеном метрики отдаются только сборщику, даже с 127.0.0.1"""
+        for authorization, status in (
+                ('', HTTPStatus.NOT_FOUND),
+                ('Bearer wrong', HTTPStatus.NOT_FOUND),
+                ('Bearer secret', HTTPStatus.OK)):
+            with self.subTest(authorization=authorization):
+                response = self.client.get(
+                    reverse('metrics'), HTTP_AUTHORIZATION=authorization)
+                self.assertEqual(response.status_code, status)
+
+    def test_exposition(self):
+        """Гистограммы по view и доля попаданий в кеш в формате Prometheus"""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        body = response.content.decode()
+        for line in (
+            '# TYPE yatube_request_seconds histogram',
+            'yatube_request_seconds_bucket{view="posts:index",le="+Inf"} 2',
+            'yatube_request_seconds_count{view="posts:index"} 2',
+            'yatube_cache_requests_total{cache="index_page",result="hit"} 1',
+            'yatube_cache_hit_ratio{cache="index_page"} 0.5',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, body.splitlines())
+
+    def test_multiprocess(self):
+        """Метрики воркеров складываются, датчики умерших отбрасываются"""
+        labels = [['view', 'posts:index']]
+        counts = [0] * (len(metrics.DURATION_BUCKETS) + 1)
+        counts[0] = 3
+        worker = {
+            'histograms': [['request_seconds', labels, counts, 0.003]],
+            'counters': [],
+            'gauges': [['queue_depth', [['queue', 'thumbnails']], 2]],
+        }
+        # Родитель тестового процесса жив, а такого pid не бывает
+        self.write_snapshot(os.getppid(), worker)
+        self.write_snapshot(2 ** 22 + 1, worker)
+        metrics.registry.observe(
+            'request_seconds', (('view', 'posts:index'),), 0.001)
+        with override_settings(METRICS_DIR=self.directory):
+            histograms, counters, gauges = metrics.collect()
+        histogram = histograms[
+            ('request_seconds', (('view', 'posts:index'),))]
+        self.assertEqual(histogram.count, 7)
+        self.assertEqual(histogram.counts[0], 7)
+        self.assertEqual(
+            gauges[('queue_depth', (('queue', 'thumbnails'),))], 2)
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, f'{os.getpid()}.json')))
+
+
+CALLS = []
+
+
+@tasks.task()
+def remember(value):
+    CALLS.append(value)
+
+
+@tasks.task(max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+@tasks.task(max_attempts=1, sensitive=True)
+def explode_secret(secret):
+    raise RuntimeError('boom')
+
+
+@override_settings(TASKS_ALWAYS_EAGER=False)
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_delay_and_work(self):
+        """Задача ждёт воркера и удаляется после выполнения"""
+        remember.delay(1)
+        remember.delay(value=2)
+        self.assertEqual(CALLS, [])
+        self.assertEqual(
+            tasks.work(['default'], burst=True, worker='test'), (2, 0))
+        self.assertEqual(CALLS, [1, 2])
+        self.assertFalse(Task.objects.exists())
+
+    def test_retry_then_fail(self):
+        """Упавшая задача повторяется позже, а после всех попыток
+        остаётся с ошибкой"""
+        explode.delay()
+        self.assertEqual(tasks.work(['default'], burst=True), (0, 1))
+        task_row = Task.objects.get()
+        self.assertEqual(task_row.status, Task.QUEUED)
+        self.assertEqual(task_row.attempts, 1)
+        self.assertGreater(task_row.run_at, timezone.now())
+        self.assertEqual(tasks.work(['default'], burst=True), (0, 0))
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(tasks.work(['default'], burst=True), (0, 1))
+        task_row = Task.objects.get()
+        self.assertEqual(task_row.status, Task.FAILED)
+        self.assertIn('boom', task_row.last_error)
+
+    def test_sensitive_payload_redacted(self):
+        """Аргументы личной задачи не остаются в базе после падения"""
+        explode_secret.delay('token')
+        self.assertEqual(tasks.work(['default'], burst=True), (0, 1))
+        task_row = Task.objects.get()
+        self.assertEqual(task_row.status, Task.FAILED)
+        self.assertNotIn('token', task_row.payload)
+        self.assertIn('boom', task_row.last_error)
+
+    @override_settings(TASK_QUEUES={'default': 1})
+    def test_concurrency_limit(self):
+        """Очередь не выдаёт задач сверх лимита одновременных"""
+        remember.delay(1)
+        remember.delay(2)
+        self.assertIsNotNone(tasks.claim(['default'], 'first'))
+        self.assertIsNone(tasks.claim(['default'], 'second'))
+
+    def test_stale_lock(self):
+        """Задача пропавшего воркера возвращается в очередь"""
+        remember.delay(1)
+        tasks.claim(['default'], 'lost')
+        Task.objects.update(locked_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(tasks.work(['default'], burst=True), (1, 0))
+        self.assertEqual(CALLS, [1])
+
+    @override_settings(TASKS_ALWAYS_EAGER=True)
+    def test_eager(self):
+        """В режиме отладки задача выполняется сразу, ошибка - в лог"""
+        remember.delay(3)
+        self.assertEqual(CALLS, [3])
+        with self.assertLogs('core.tasks', 'ERROR'):
+            explode.delay()
+        self.assertFalse(Task.objects.exists())
+
+    def test_queue_depth(self):
+        """Длина очереди попадает в метрики"""
+        remember.delay(1)
+        remember.delay(2)
+        _, _, gauges = metrics.collect()
+        self.assertEqual(gauges[('queue_depth', (('queue', 'default'),))], 2)
+
+    def test_command(self):
+        remember.delay(1)
+        out = StringIO()
+        call_command('run_tasks', '--burst', '--queue', 'default', stdout=out)
+        self.assertIn('Выполнено задач: 1', out.getvalue())
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def read_db(self, request, view=None):
+        """Из какой базы читает view и ответ middleware."""
+        used = []
+
+        def get_response(request):
+            used.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        if view is not None:
+            get_response = view(get_response)
+        response = ReplicaMiddleware(get_response)(request)
+        return used[0], response
+
+    def test_router(self):
+        """Реплики только внутри replica_reads и не под pinned"""
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), 'replica_0')
+            with db_router.pinned():
+                self.assertEqual(self.router.db_for_read(Post), 'default')
+            self.assertEqual(self.router.db_for_read(Post), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertFalse(
+            self.router.allow_migrate('replica_0', 'posts'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        with db_router.replica_reads():
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_reads_go_to_replica(self):
+        database, response = self.read_db(self.factory.get('/'))
+        self.assertEqual(database, 'replica_0')
+        self.assertNotIn('use_primary', response.cookies)
+
+    def test_read_your_writes(self):
+        """После записи клиент какое-то время читает из основной базы"""
+        database, response = self.read_db(self.factory.post('/'))
+        self.assertEqual(database, 'default')
+        cookie = response.cookies['use_primary']
+        self.assertEqual(cookie['max-age'], 10)
+        request = self.factory.get('/')
+        request.COOKIES['use_primary'] = cookie.value
+        database, _ = self.read_db(request)
+        self.assertEqual(database, 'default')
+
+    def test_use_primary_view(self):
+        """GET-view, которое пишет, читает из основной базы"""
+        database, response = self.read_db(
+            self.factory.get('/'), view=db_router.use_primary)
+        self.assertEqual(database, 'default')
+        self.assertIn('use_primary', response.cookies)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=60)
+    def test_shared_cache_reads_primary(self):
+        """Страница и фрагмент для общего кеша строятся из основной базы:
+        под свежей версией не ложится отставшая копия реплики"""
+        fragments().clear()
+
+        def build():
+            return self.router.db_for_read(Post)
+
+        @page_cache.cache_page(lambda request: [1])
+        def view(request):
+            return HttpResponse(build())
+
+        response = ReplicaMiddleware(view)(self.factory.get('/'))
+        self.assertEqual(response.content, b'default')
+        with db_router.replica_reads():
+            self.assertEqual(get_or_build('fragment', build, 60), 'default')
+            # Промах без записи в кеш по-прежнему читает с реплики
+            self.assertEqual(build(), 'replica_0')
+
+    def test_failed_write_not_sticky(self):
+        middleware = ReplicaMiddleware(
+            lambda request: HttpResponseNotFound())
+        response = middleware(self.factory.post('/'))
+        self.assertNotIn('use_primary', response.cookies)
+
+
+class SQLiteBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def wrapper(self):
+        settings_dict = {
+            **connection.settings_dict,
+            'NAME': os.path.join(self.directory, 'test.sqlite3'),
+        }
+        return DatabaseWrapper(settings_dict, alias='tuned')
+
+    def test_pragmas(self):
+        """Соединение открывается с PRAGMA из настроек"""
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            for pragma, value in (
+                    ('journal_mode', 'wal'),
+                    ('synchronous', 1),
+                    ('busy_timeout', 5000),
+                    ('cache_size', -64000)):
+                with self.subTest(pragma=pragma):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    self.assertEqual(cursor.fetchone()[0], value)
+        wrapper.close()
+
+    def test_immediate_transaction(self):
+        """Транзакция сразу берёт блокировку записи"""
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(wrapper.settings_dict['NAME'], timeout=0)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        other.close()
+        wrapper.connection.rollback()
+        wrapper.close()
+
+    def test_invalid_pragma(self):
+        with self.assertRaises(ImproperlyConfigured):
+            apply_pragmas(None, {'cache_size; DROP TABLE x': 1})
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command(
+            'sqlite_benchmark', readers=1, writers=1, duration=0.2,
+            posts=10, stdout=out)
+        self.assertIn('stock', out.getvalue())
+        self.assertIn('tuned', out.getvalue())
@@ -1,5 +1,12 @@
+import hmac
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from core import metrics
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -17,3 +24,34 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def _metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return False
+    if not settings.METRICS_TOKEN:
+        return True
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    return hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(),
+        expected.encode())
+
+
+def prometheus_metrics(request):
+    # Метрики внутренние: чужим отвечаем, будто страницы нет
+    if not _metrics_allowed(request):
+        raise Http404
+    histograms, counters, gauges = metrics.collect()
+    requests = defaultdict(lambda: {'hit': 0, 'miss': 0})
+    for (name, labels), value in counters.items():
+        if name == 'cache_requests':
+            labels = dict(labels)
+            requests[labels['cache']][labels['result']] += value
+    for cache, results in requests.items():
+        total = results['hit'] + results['miss']
+        gauges[('cache_hit_ratio', (('cache', cache),))] = (
+            results['hit'] / total if total else 0.0)
+    return HttpResponse(
+        metrics.exposition(histograms, counters, gauges),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
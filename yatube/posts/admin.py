@@ -1,4 +1,5 @@
 from django.contrib import admin
+from . import search
 from .models import Group, Post
 
 
@@ -13,6 +14,12 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group', )
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем через полнотекстовый индекс, а не LIKE по всей таблице
+        if not search_term:
+            return queryset, False
+        return search.get_backend().filter(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'description')
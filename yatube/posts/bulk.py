@@ -0,0 +1,40 @@
+"""Массовая запись постов, комментариев и подписок.
+
+``bulk_create`` не шлёт сигналов, поэтому счётчики, поисковый индекс,
+ленты подписок и версии кэша страниц после массовой записи
+пересчитываются один раз - ``rebuild()``, - а не на каждую строку.
+"""
+from django.db import connections, router
+
+from . import caching, counters, search, timeline
+
+
+def insert(model, objects, batch_size=1000):
+    """Вставляет объекты пачками и возвращает их id по порядку.
+
+    SQLite не возвращает id из bulk_create, поэтому новые строки
+    находятся по id больше прежнего максимального. Вызывать внутри
+    транзакции: с BEGIN IMMEDIATE чужие вставки между запросами
+    невозможны.
+    """
+    objects = list(objects)
+    # Django 2.2 не ограничивает заданный batch_size возможностями базы,
+    # а SQLite не принимает больше 500 строк в одном INSERT
+    ops = connections[router.db_for_write(model)].ops
+    batch_size = min(batch_size, max(
+        ops.bulk_batch_size(model._meta.concrete_fields, objects), 1))
+    last = model.objects.order_by('-pk').values_list(
+        'pk', flat=True).first() or 0
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    return list(
+        model.objects.filter(pk__gt=last).order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def rebuild(batch_size=1000):
+    """Приводит производные данные в соответствие с таблицами."""
+    counters.recount(batch_size=batch_size)
+    timeline.rebuild()
+    search.get_backend().rebuild()
+    caching.bump_all()
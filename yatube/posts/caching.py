@@ -0,0 +1,153 @@
+"""Версии ленты и страниц для ключей кеша и условных GET-запросов.
+
+Любая запись поста (создание, правка, удаление) поднимает версию ленты,
+поэтому закешированные фрагменты ленты можно хранить часами:
+после записи они перестают совпадать по ключу и рендерятся заново.
+
+Так же устроены версии отдельных страниц - группы, профиля и поста;
+по ним же ключуется кеш целых страниц.
+Ключи версий строятся из того, что есть в адресе страницы (slug группы,
+имя автора, id поста), поэтому валидаторы для ответа 304 считаются
+по одному походу в кеш, без запросов к базе.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.views.decorators.http import condition
+
+from core import page_cache
+
+from .models import Group
+
+FEED_VERSION_KEY = 'posts:feed_version'
+# Поднимается массовыми операциями, меняет версии всех страниц разом
+EPOCH_KEY = 'posts:epoch'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def group_key(slug):
+    return f'posts:version:group:{slug}'
+
+
+def author_key(username):
+    return f'posts:version:author:{username}'
+
+
+def post_key(post_id):
+    return f'posts:version:post:{post_id}'
+
+
+def post_page_keys(post_id, author_id, group_ids=()):
+    """Ключи версий всех страниц, на которых виден пост."""
+    group_ids = set(group_ids) - {None}
+    slugs = Group.objects.filter(id__in=group_ids).values_list(
+        'slug', flat=True) if group_ids else []
+    usernames = get_user_model().objects.filter(id=author_id).values_list(
+        'username', flat=True)
+    return [
+        FEED_VERSION_KEY,
+        post_key(post_id),
+        *(author_key(username) for username in usernames),
+        *(group_key(slug) for slug in slugs),
+    ]
+
+
+def versions(*keys):
+    """Версии по ключам. Ключ без версии получает текущее время."""
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = _now_ms()
+        for key in missing:
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+def bump(*keys):
+    """Поднимает версии ключей до текущего времени.
+
+    Внутри транзакции версии поднимаются ещё раз после коммита. Читатель
+    между записью и коммитом видит новую версию, но старые данные, и
+    кеширует их под этой версией; второй подъём отбрасывает такую копию.
+    """
+    _bump(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(keys))
+
+
+def _bump(keys):
+    now = _now_ms()
+    current = cache.get_many(keys)
+    cache.set_many(
+        {key: max(now, current.get(key, 0) + 1) for key in keys}, None)
+
+
+def feed_version():
+    """Текущая версия ленты — время последней записи в миллисекундах."""
+    return versions(FEED_VERSION_KEY)[0]
+
+
+def bump_all():
+    """Сбрасывает версии всех страниц после массовых изменений."""
+    bump(FEED_VERSION_KEY, EPOCH_KEY)
+
+
+def _page_versions(request, keys, *args, **kwargs):
+    # Версии нужны и валидаторам, и кешу страницы: читаем их один раз
+    if not hasattr(request, '_page_versions'):
+        request._page_versions = versions(
+            EPOCH_KEY, *keys(request, *args, **kwargs))
+    return request._page_versions
+
+
+def conditional(keys, variant=None):
+    """Отвечает 304, если версии страницы не менялись с прошлого визита.
+
+    ``keys(request, *args, **kwargs)`` возвращает ключи версий, от которых
+    зависит страница. ETag учитывает ещё и пользователя с его CSRF-токеном:
+    одна и та же страница у разных пользователей выглядит по-разному.
+    Так же в него входит ``variant(request)`` - представление страницы.
+    Last-Modified отдаётся только анонимам - по одной дате нельзя
+    отличить страницу гостя от страницы вошедшего пользователя.
+    """
+    def page_versions(request, *args, **kwargs):
+        return _page_versions(request, keys, *args, **kwargs)
+
+    def etag(request, *args, **kwargs):
+        parts = [
+            request.user.pk or 0,
+            request.META.get('CSRF_COOKIE', ''),
+            *page_versions(request, *args, **kwargs),
+        ]
+        if variant is not None:
+            parts.append(variant(request))
+        raw = ':'.join(str(part) for part in parts)
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        latest = max(page_versions(request, *args, **kwargs))
+        return datetime.fromtimestamp(latest / 1000, tz=timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def cached_page(keys, variant=None):
+    """``conditional`` вместе с кешем целой страницы по тем же версиям."""
+    def decorator(view):
+        view = page_cache.cache_page(
+            lambda request, *args, **kwargs: _page_versions(
+                request, keys, *args, **kwargs),
+            variant=variant,
+        )(view)
+        return conditional(keys, variant=variant)(view)
+    return decorator
@@ -0,0 +1,91 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются сигналами вместе с записью, которую они считают;
+``recount`` пересчитывает их с нуля, если они разошлись с данными.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+def _shifted(field, delta):
+    # Счётчики беззнаковые: разошедшийся счётчик не должен ронять запись
+    return Greatest(F(field) + delta, 0)
+
+
+def change_user(user_id, field, delta):
+    """Меняет счётчик пользователя, при необходимости заводит строку."""
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: _shifted(field, delta)})
+    if not updated:
+        _, created = UserStats.objects.get_or_create(
+            user_id=user_id, defaults={field: max(delta, 0)})
+        if not created:
+            UserStats.objects.filter(user_id=user_id).update(
+                **{field: _shifted(field, delta)})
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(id=group_id).update(
+            posts_count=_shifted('posts_count', delta))
+
+
+def change_post(post_id, delta):
+    Post.objects.filter(id=post_id).update(
+        comments_count=_shifted('comments_count', delta))
+
+
+def user_stats(user):
+    """Счётчики пользователя; нулевые, если строки ещё нет."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _actual(model, field):
+    rows = (
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+COUNTERS = (
+    (UserStats, 'posts_count', Post, 'author'),
+    (UserStats, 'followers_count', Follow, 'author'),
+    (UserStats, 'following_count', Follow, 'user'),
+    (Group, 'posts_count', Post, 'group'),
+    (Post, 'comments_count', Comment, 'post'),
+)
+
+
+def recount(batch_size=1000):
+    """Пересчитывает все счётчики одним UPDATE на счётчик.
+
+    Возвращает словарь «счётчик -> число исправленных строк».
+    """
+    repaired = {}
+    with transaction.atomic():
+        missing = User.objects.filter(stats__isnull=True).values_list(
+            'pk', flat=True)
+        UserStats.objects.bulk_create(
+            (UserStats(user_id=pk) for pk in missing.iterator()),
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        for model, field, source, source_field in COUNTERS:
+            actual = _actual(source, source_field)
+            name = f'{model._meta.model_name}.{field}'
+            repaired[name] = model.objects.exclude(
+                **{field: actual}).update(**{field: actual})
+    return repaired
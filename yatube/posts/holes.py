@@ -0,0 +1,23 @@
+"""Дырки в кешированных страницах постов: всё, что зависит от читателя."""
+from core.page_cache import register_hole
+
+from .forms import CommentForm
+from .models import Follow
+
+
+@register_hole('switcher', 'posts/includes/switcher.html')
+def switcher_context(request, index=0, follow=0):
+    # Вкладки видит только вошедший читатель
+    return {}
+
+
+@register_hole('post_actions', 'posts/includes/post_actions.html')
+def post_actions_context(request, post_id, author_id):
+    return {'form': CommentForm()}
+
+
+@register_hole('follow_button', 'posts/includes/follow_button.html')
+def follow_button_context(request, username):
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author__username=username).exists()
+    return {'following': following}
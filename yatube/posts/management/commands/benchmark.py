@@ -0,0 +1,201 @@
+import json
+import math
+import random
+import time
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Group, Post
+
+User = get_user_model()
+
+# Сколько разных адресов и читателей берётся для каждой страницы
+SAMPLE_SIZE = 20
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Перцентиль по ближайшему рангу из отсортированного списка."""
+    if not values:
+        return 0.0
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет ленты и страницы постов через тестовый клиент '
+        'и выводит перцентили времени ответа и число запросов к базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=100,
+            help='Число замеров на каждую страницу',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='Число запросов без замера перед каждой страницей',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кеш перед каждым запросом',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--save',
+            help='Сохранить результаты в JSON, например как базовую линию',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='Сравнить с сохранённым прогоном и упасть при регрессии',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимый рост p95 относительно базовой линии',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        results = {}
+        for name, requests in self.targets().items():
+            if not requests:
+                self.stderr.write(f'{name}: нет данных, пропускаем')
+                continue
+            results[name] = self.measure(requests, options)
+        self.report(results)
+        if options['save']:
+            with open(options['save'], 'w') as output:
+                json.dump(results, output, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def targets(self):
+        """Страница -> список пар (клиент, адрес) для замеров."""
+        guest = Client()
+        groups = Group.objects.filter(posts_count__gt=0).values_list(
+            'slug', flat=True)[:SAMPLE_SIZE]
+        authors = (
+            Post.objects.order_by().values('author__username')
+            .annotate(total=Count('id')).order_by('-total')
+            .values_list('author__username', flat=True)[:SAMPLE_SIZE]
+        )
+        posts = Post.objects.values_list('id', flat=True)[:SAMPLE_SIZE]
+        readers = []
+        for user in (
+                User.objects.filter(stats__following_count__gt=0)
+                .order_by('-stats__following_count')[:SAMPLE_SIZE]):
+            client = Client()
+            client.force_login(user)
+            readers.append(client)
+        return {
+            'index': [(guest, reverse('posts:index'))],
+            'group_posts': [
+                (guest, reverse('posts:current_post', args=[slug]))
+                for slug in groups
+            ],
+            'profile': [
+                (guest, reverse('posts:profile', args=[username]))
+                for username in authors
+            ],
+            'post_detail': [
+                (guest, reverse('posts:post_detail', args=[post_id]))
+                for post_id in posts
+            ],
+            'follow_index': [
+                (client, reverse('posts:follow_index')) for client in readers
+            ],
+        }
+
+    def measure(self, requests, options):
+        for _ in range(options['warmup']):
+            client, url = self.random.choice(requests)
+            client.get(url)
+        timings = []
+        queries = []
+        for _ in range(options['requests']):
+            client, url = self.random.choice(requests)
+            if options['cold']:
+                cache.clear()
+            counter = QueryCounter()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{url} ответил кодом {response.status_code}')
+            timings.append(elapsed * 1000)
+            queries.append(counter.count)
+        timings.sort()
+        result = {
+            f'p{rank}': round(percentile(timings, rank), 2)
+            for rank in PERCENTILES
+        }
+        result['queries_avg'] = round(sum(queries) / len(queries), 1)
+        result['queries_max'] = max(queries)
+        return result
+
+    def report(self, results):
+        columns = [
+            *(f'p{rank}, мс' for rank in PERCENTILES),
+            'запросов ср.', 'запросов макс.',
+        ]
+        self.stdout.write(
+            f'{"страница":<14}' + ''.join(f'{name:>16}' for name in columns))
+        for name, result in results.items():
+            values = [
+                *(result[f'p{rank}'] for rank in PERCENTILES),
+                result['queries_avg'], result['queries_max'],
+            ]
+            self.stdout.write(
+                f'{name:<14}' + ''.join(f'{value:>16}' for value in values))
+
+    def compare(self, results, path, tolerance):
+        try:
+            with open(path) as saved:
+                baseline = json.load(saved)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не прочитать базовую линию {path}: {error}')
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['p95'] > before['p95'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {before["p95"]} -> {result["p95"]} мс')
+            if result['queries_max'] > before['queries_max']:
+                regressions.append(
+                    f'{name}: запросов {before["queries_max"]} -> '
+                    f'{result["queries_max"]}')
+        if regressions:
+            raise CommandError(
+                'Регрессия относительно базовой линии:\n'
+                + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базовой линии нет'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты, комментарии, подписки или группы в NDJSON '
+        'или CSV, читая таблицу пачками по первичному ключу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(export.EXPORTS))
+        parser.add_argument(
+            '--format',
+            dest='export_format',
+            choices=sorted(export.FORMATS),
+            default='ndjson',
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки. По умолчанию - стандартный вывод',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=export.BATCH_SIZE,
+            help='Строк в одном запросе к базе',
+        )
+
+    def handle(self, *args, **options):
+        lines = export.export(
+            options['name'], options['export_format'],
+            batch_size=options['batch_size'])
+        if not options['output']:
+            self.write(lines, self.stdout)
+            return
+        with open(options['output'], 'w', encoding='utf-8',
+                  newline='') as output:
+            rows = self.write(lines, output)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено строк: {rows} в {options["output"]}'))
+
+    def write(self, lines, output):
+        rows = 0
+        for line in lines:
+            output.write(line)
+            rows += 1
+        return rows
@@ -0,0 +1,217 @@
+import random
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from posts import bulk
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Сколько разных картинок делят между собой посты с картинками
+IMAGE_POOL_SIZE = 10
+
+
+def power_law(count, alpha):
+    """Веса по закону Ципфа: у первого элемента самый большой."""
+    return [1 / (rank + 1) ** alpha for rank in range(count)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками для нагрузочных тестов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--images',
+            type=float,
+            default=0.3,
+            help='Доля постов с картинкой',
+        )
+        parser.add_argument(
+            '--alpha',
+            type=float,
+            default=1.2,
+            help='Показатель степенного закона для популярности авторов',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько дней распределены даты постов',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        Faker.seed(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        users = self.stage('Пользователи', self.create_users, options)
+        # Популярность авторов: одни и те же авторы больше пишут
+        # и на них больше подписываются
+        self.random.shuffle(users)
+        self.weights = power_law(len(users), options['alpha'])
+        groups = self.stage('Группы', self.create_groups, options)
+        posts = self.stage('Посты', self.create_posts, users, groups, options)
+        self.stage('Комментарии', self.create_comments, users, posts, options)
+        self.stage('Подписки', self.create_follows, users, options)
+        self.stage('Счётчики, ленты и поиск', self.rebuild)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с. Превью картинок '
+            'строит команда warm_thumbnails'))
+
+    def stage(self, title, step, *args):
+        started = time.monotonic()
+        result = step(*args)
+        created = f': {len(result)}' if result is not None else ''
+        self.stdout.write(
+            f'{title}{created} ({time.monotonic() - started:.1f} с)')
+        return result
+
+    def create(self, model, objects):
+        # bulk.insert находит новые id по максимальному, поэтому вставка
+        # и чтение id идут в одной транзакции
+        with transaction.atomic():
+            return bulk.insert(model, objects, batch_size=self.batch_size)
+
+    def create_users(self, options):
+        start = User.objects.count()
+        users = []
+        for number in range(start, start + options['users']):
+            user = User(
+                username=f'{self.fake.user_name()}{number}',
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+            )
+            user.set_unusable_password()
+            users.append(user)
+        return self.create(User, users)
+
+    def create_groups(self, options):
+        start = Group.objects.count()
+        return self.create(Group, [
+            Group(
+                title=self.fake.catch_phrase()[:200],
+                slug=f'group-{number}',
+                description=self.fake.paragraph(),
+            )
+            for number in range(start, start + options['groups'])
+        ])
+
+    def create_images(self):
+        names = []
+        for number in range(IMAGE_POOL_SIZE):
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            output = BytesIO()
+            Image.new('RGB', (960, 640), color).save(output, 'JPEG')
+            names.append(default_storage.save(
+                f'posts/generated_{number}.jpg',
+                ContentFile(output.getvalue()),
+            ))
+        return names
+
+    def create_posts(self, users, groups, options):
+        if not users:
+            return []
+        images = self.create_images() if options['images'] > 0 else []
+        now = timezone.now()
+        span = timedelta(days=options['days']).total_seconds()
+        dates = sorted(
+            now - timedelta(seconds=self.random.uniform(0, span))
+            for _ in range(options['posts'])
+        )
+        group_weights = power_law(len(groups), options['alpha'])
+        authors = self.random.choices(
+            users, self.weights, k=options['posts'])
+        posts = []
+        for author_id in authors:
+            group_id = None
+            if groups and self.random.random() < 0.7:
+                group_id = self.random.choices(groups, group_weights)[0]
+            image = ''
+            if images and self.random.random() < options['images']:
+                image = self.random.choice(images)
+            posts.append(Post(
+                text=self.fake.text(max_nb_chars=600),
+                author_id=author_id,
+                group_id=group_id,
+                image=image,
+            ))
+        ids = self.create(Post, posts)
+        # Дата создания проставляется при вставке, поэтому разносится
+        # по времени отдельным проходом; порядок id совпадает с датами
+        Post.objects.bulk_update(
+            [Post(pk=pk, created=created) for pk, created in zip(ids, dates)],
+            ['created'],
+            batch_size=self.batch_size,
+        )
+        return ids
+
+    def create_comments(self, users, posts, options):
+        if not users or not posts:
+            return []
+        # Обсуждают в основном свежие посты
+        weights = power_law(len(posts), options['alpha'])
+        return self.create(Comment, [
+            Comment(
+                post_id=post_id,
+                author_id=self.random.choice(users),
+                text=self.fake.sentence(nb_words=12),
+            )
+            for post_id in self.random.choices(
+                posts[::-1], weights, k=options['comments'])
+        ])
+
+    def create_follows(self, users, options):
+        if len(users) < 2 or not options['follows']:
+            return []
+        existing = set(Follow.objects.values_list('user_id', 'author_id'))
+        follows = []
+        for user_id in users:
+            wanted = min(
+                round(self.random.expovariate(1 / options['follows'])),
+                len(users) - 1,
+            )
+            authors = set()
+            # Выбор с возвращением: берём с запасом и отбрасываем повторы
+            while len(authors) < wanted:
+                authors.update(
+                    author_id
+                    for author_id in self.random.choices(
+                        users, self.weights, k=wanted * 2)
+                    if author_id != user_id
+                )
+            for author_id in list(authors)[:wanted]:
+                if (user_id, author_id) not in existing:
+                    follows.append(
+                        Follow(user_id=user_id, author_id=author_id))
+        return self.create(Follow, follows)
+
+    def rebuild(self):
+        # bulk_create не шлёт сигналы: всё, что они поддерживают,
+        # пересчитывается один раз в конце
+        bulk.rebuild(batch_size=self.batch_size)
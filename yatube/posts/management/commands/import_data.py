@@ -0,0 +1,224 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import bulk
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+def read(path, input_format):
+    """Записи файла словарями по одной, не читая файл целиком."""
+    with open(path, encoding='utf-8', newline='') as source:
+        if input_format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def batches(records, size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_created(value):
+    if not value:
+        return timezone.now()
+    created = parse_datetime(value)
+    if created is None:
+        raise CommandError(f'Неверная дата: {value}')
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created)
+    return created
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты и комментарии из NDJSON или CSV пачками '
+        'bulk_create и один раз в конце пересчитывает счётчики, '
+        'поисковый индекс и ленты подписок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts',
+            help='Файл постов: id, author, group, text, created, image',
+        )
+        parser.add_argument(
+            '--comments',
+            help='Файл комментариев: post (id поста из --posts), author, '
+                 'text, created',
+        )
+        parser.add_argument(
+            '--format',
+            dest='input_format',
+            choices=('ndjson', 'csv'),
+            help='По умолчанию - по расширению файла',
+        )
+        parser.add_argument(
+            '--media-source',
+            default='.',
+            help='Каталог, от которого отсчитываются пути картинок',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Потоков для копирования картинок',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Строк в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        if not options['posts']:
+            raise CommandError('Укажите файл постов --posts')
+        self.options = options
+        self.batch_size = options['batch_size']
+        # Авторы и группы ищутся по словарям в памяти, а не запросом
+        # на каждую строку; старые id постов - для комментариев
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.posts = {}
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['workers']) as self.pool:
+            self.stage('Посты', self.import_posts, options['posts'])
+        if options['comments']:
+            self.stage(
+                'Комментарии', self.import_comments, options['comments'])
+        self.stage('Счётчики, ленты и поиск', bulk.rebuild, self.batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с. Превью картинок '
+            'строит команда warm_thumbnails'))
+
+    def stage(self, title, step, *args):
+        started = time.monotonic()
+        result = step(*args)
+        created = f': {result}' if result is not None else ''
+        self.stdout.write(
+            f'{title}{created} ({time.monotonic() - started:.1f} с)')
+
+    def records(self, path):
+        input_format = self.options['input_format'] or (
+            'csv' if path.endswith('.csv') else 'ndjson')
+        return batches(read(path, input_format), self.batch_size)
+
+    def resolve(self, known, model, keys, make):
+        """Создаёт недостающих авторов или группы пачки."""
+        missing = sorted(set(keys) - known.keys())
+        if missing:
+            with transaction.atomic():
+                ids = bulk.insert(
+                    model, [make(key) for key in missing], self.batch_size)
+            known.update(zip(missing, ids))
+
+    def make_user(self, username):
+        user = User(username=username)
+        user.set_unusable_password()
+        return user
+
+    def make_group(self, slug):
+        return Group(slug=slug, title=slug, description='')
+
+    def copy_image(self, name):
+        if not name:
+            return ''
+        path = os.path.join(self.options['media_source'], name)
+        if not os.path.isfile(path):
+            return ''
+        with open(path, 'rb') as source:
+            return default_storage.save(
+                f'posts/{os.path.basename(name)}', File(source))
+
+    def import_posts(self, path):
+        total = 0
+        for batch in self.records(path):
+            self.resolve(
+                self.users, User, (row['author'] for row in batch),
+                self.make_user)
+            self.resolve(
+                self.groups, Group,
+                (row['group'] for row in batch if row.get('group')),
+                self.make_group)
+            # Картинки пачки копируются параллельно, пока база ждёт
+            images = self.pool.map(
+                self.copy_image, [row.get('image') for row in batch])
+            posts = [
+                Post(
+                    text=row['text'],
+                    author_id=self.users[row['author']],
+                    group_id=self.groups.get(row.get('group')),
+                    image=image,
+                )
+                for row, image in zip(batch, images)
+            ]
+            with transaction.atomic():
+                ids = bulk.insert(Post, posts, self.batch_size)
+                # auto_now_add перезаписывает дату при вставке
+                Post.objects.bulk_update(
+                    [
+                        Post(pk=pk, created=parse_created(row.get('created')))
+                        for pk, row in zip(ids, batch)
+                    ],
+                    ['created'],
+                    batch_size=self.batch_size,
+                )
+            self.posts.update(
+                (str(row['id']), pk)
+                for row, pk in zip(batch, ids) if row.get('id')
+            )
+            total += len(ids)
+        return total
+
+    def import_comments(self, path):
+        total = skipped = 0
+        for batch in self.records(path):
+            # Комментарии к постам, которых нет в файле постов, пропускаются
+            known = [row for row in batch if str(row['post']) in self.posts]
+            skipped += len(batch) - len(known)
+            batch = known
+            self.resolve(
+                self.users, User, (row['author'] for row in batch),
+                self.make_user)
+            comments = [
+                Comment(
+                    post_id=self.posts[str(row['post'])],
+                    author_id=self.users[row['author']],
+                    text=row['text'],
+                )
+                for row in batch
+            ]
+            with transaction.atomic():
+                ids = bulk.insert(Comment, comments, self.batch_size)
+                Comment.objects.bulk_update(
+                    [
+                        Comment(
+                            pk=pk, created=parse_created(row.get('created')))
+                        for pk, row in zip(ids, batch)
+                    ],
+                    ['created'],
+                    batch_size=self.batch_size,
+                )
+            total += len(ids)
+        return f'{total}, пропущено {skipped}'
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Размер пачки при создании недостающих строк счётчиков',
+        )
+
+    def handle(self, *args, **options):
+        repaired = counters.recount(batch_size=options['batch_size'])
+        for name, rows in repaired.items():
+            self.stdout.write(f'{name}: исправлено строк {rows}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
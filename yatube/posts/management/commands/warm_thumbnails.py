@@ -0,0 +1,133 @@
+import json
+import multiprocessing
+import os
+import time
+
+import django
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import caching, thumbnails
+from posts.models import Post
+
+
+def _init_worker():
+    # При запуске через spawn дочернему процессу нужен свой setup,
+    # а унаследованные через fork соединения с базой использовать нельзя
+    django.setup()
+    connections.close_all()
+
+
+def _warm(item):
+    pk, name = item
+    try:
+        if not default_storage.exists(name):
+            return pk, None, 'нет файла'
+        urls = thumbnails.build(name, verify=True)
+        return pk, urls[thumbnails.FEED_VARIANT], None
+    except Exception as error:
+        return pk, None, str(error)
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит все варианты превью картинок постов в пуле процессов '
+        'и заполняет хранилище sorl-thumbnail'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов; 0 - строить в текущем процессе',
+        )
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument(
+            '--state-file',
+            default=os.path.join(
+                settings.MEDIA_ROOT, 'cache', 'warm_thumbnails.json'),
+            help='Файл с номером последнего обработанного поста; '
+                 'остаётся только после прерванного запуска',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать с первого поста, не глядя на сохранённое состояние',
+        )
+
+    def handle(self, *args, **options):
+        state_file = options['state_file']
+        last_pk = 0 if options['restart'] else self.read_state(state_file)
+        if last_pk:
+            self.stdout.write(f'Продолжаем после поста {last_pk}')
+        pool = None
+        if options['processes']:
+            # Дочерние процессы не должны делить соединение родителя
+            connections.close_all()
+            pool = multiprocessing.Pool(
+                options['processes'], initializer=_init_worker)
+        started = time.monotonic()
+        done = failed = 0
+        try:
+            while True:
+                batch = list(
+                    Post.objects.filter(pk__gt=last_pk)
+                    .exclude(image='')
+                    .order_by('pk')
+                    .values_list('pk', 'image')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                results = (pool.map if pool else map)(_warm, batch)
+                done, failed = self.save(results, done, failed)
+                last_pk = batch[-1][0]
+                self.write_state(state_file, last_pk)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Обработано {done + failed} картинок '
+                    f'({(done + failed) / elapsed:.1f} в секунду)')
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        # Все посты обработаны: следующий запуск начнёт с начала
+        self.clear_state(state_file)
+        if done:
+            caching.bump_all()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: превью построены для {done} картинок, '
+            f'ошибок {failed}, {elapsed:.1f} с'))
+
+    def save(self, results, done, failed):
+        posts = []
+        for pk, url, error in results:
+            if error:
+                failed += 1
+                self.stderr.write(f'Пост {pk}: {error}')
+                continue
+            done += 1
+            posts.append(Post(pk=pk, thumbnail=url))
+        Post.objects.bulk_update(posts, ['thumbnail'])
+        return done, failed
+
+    def read_state(self, state_file):
+        try:
+            with open(state_file) as state:
+                return json.load(state)['last_pk']
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def write_state(self, state_file, last_pk):
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        with open(state_file, 'w') as state:
+            json.dump({'last_pk': last_pk}, state)
+
+    def clear_state(self, state_file):
+        try:
+            os.remove(state_file)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_auto_20220328_2051'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ('-created', '-id'), 'verbose_name': 'Пост', 'verbose_name_plural': 'Посты'},
+        ),
+    ]
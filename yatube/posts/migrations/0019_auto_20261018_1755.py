@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+def delete_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    duplicates = (
+        Follow.objects.values('user_id', 'author_id')
+        .annotate(first=models.Min('id'), total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        Follow.objects.filter(
+            user_id=duplicate['user_id'],
+            author_id=duplicate['author_id'],
+        ).exclude(id=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_auto_20261018_1754'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='posts_comme_post_id_944a68_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created', '-id'], name='posts_post_author__670917_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-created', '-id'], name='posts_post_group_i_4f531a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created', '-id'], name='posts_post_created_a3cb1b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
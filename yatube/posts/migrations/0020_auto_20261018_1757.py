@@ -0,0 +1,74 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import Coalesce
+
+
+def _actual(model, field):
+    rows = (
+        model.objects.filter(**{field: models.OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=models.Count('pk'))
+        .values('total')
+    )
+    return Coalesce(
+        models.Subquery(rows, output_field=models.IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('posts', 'UserStats')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in User.objects.values_list(
+            'pk', flat=True)],
+        batch_size=1000,
+    )
+    UserStats.objects.update(
+        posts_count=_actual(Post, 'author'),
+        followers_count=_actual(Follow, 'author'),
+        following_count=_actual(Follow, 'user'),
+    )
+    Group.objects.update(posts_count=_actual(Post, 'group'))
+    Post.objects.update(comments_count=_actual(Comment, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0019_auto_20261018_1755'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_auto_20261018_1757'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Превью'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:09
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # Полнотекстовый индекс есть только у SQLite; на других базах
+    # поиск работает через SearchBackend без индекса
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE posts_post_fts USING fts5('
+        "text, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_post_fts (rowid, text) '
+        'SELECT id, text FROM posts_post'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
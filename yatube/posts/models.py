@@ -5,6 +5,27 @@ from core.models import CreatedModel
 User = get_user_model()
 
 
+# Поля поста, которые выводит post_list.html
+FEED_FIELDS = (
+    'id',
+    'created',
+    'text',
+    'image',
+    'thumbnail',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__slug',
+)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа подтягиваются тем же запросом,
+        из таблиц берутся только поля, которые выводит post_list.html."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+
 class Post(CreatedModel):
     text = models.TextField(
         'Текст поста',
@@ -33,11 +54,32 @@ class Post(CreatedModel):
     )
     # Аргумент upload_to указывает директорию,
     # в которую будут загружаться пользовательские файлы.
+    # Ссылка на превью для лент, строится в фоне после загрузки картинки
+    thumbnail = models.CharField(
+        'Превью',
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-created',)
+        ordering = ('-created', '-id')
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы под ленты: фильтр по автору или группе
+        # и сортировка в порядке ключа курсора
+        indexes = [
+            models.Index(fields=['author', '-created', '-id']),
+            models.Index(fields=['group', '-created', '-id']),
+            models.Index(fields=['-created', '-id']),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -47,6 +89,11 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = 'Группа'
@@ -71,6 +118,11 @@ class Comment(CreatedModel):
     )
     text = models.TextField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created']),
+        ]
+
     def __str__(self):
         return self.text[:15]
 
@@ -88,3 +140,71 @@ class Follow(models.Model):
         related_name='following',
         on_delete=models.CASCADE
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, поддерживаемые при записи."""
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        related_name='stats',
+        primary_key=True,
+        on_delete=models.CASCADE
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class TimelineEntry(models.Model):
+    """Строка материализованной ленты подписок читателя."""
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        related_name='timeline',
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        related_name='timeline_entries',
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор поста',
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    # Копия Post.created: лента читается диапазоном по индексу
+    # (user, created), без соединения с таблицей постов.
+    created = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        ordering = ('-created', '-post_id')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        indexes = [
+            models.Index(fields=['user', '-created', '-post']),
+            models.Index(fields=['user', 'author', '-created']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_post'),
+        ]
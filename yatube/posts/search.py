@@ -0,0 +1,120 @@
+"""Полнотекстовый поиск по постам.
+
+Бэкенд выбирается настройкой ``POSTS_SEARCH_BACKEND``. Основной бэкенд
+держит текст постов в виртуальной таблице SQLite FTS5 ``posts_post_fts``
+(rowid строки - id поста) и ранжирует найденное по bm25. Индекс
+обновляется сигналами при создании, правке и удалении поста.
+
+Порядок найденного по bm25 - порядок «лучшее из возможного»: ранг
+зависит от статистики всего индекса, поэтому любая запись поста между
+загрузками страниц сдвигает ранги, и страница по курсору может
+пропустить или повторить несколько постов. Для поиска это допустимо:
+первые страницы самые точные, а без ранга поиск не нужен. Стабильные
+страницы даёт ``SearchBackend`` с ключом ``('-created', '-id')``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+FTS_TABLE = 'posts_post_fts'
+
+WORD = re.compile(r'\w+')
+
+
+def get_backend():
+    return import_string(settings.POSTS_SEARCH_BACKEND)()
+
+
+class SearchBackend:
+    """Поиск без индекса: ``LIKE`` по тексту, новые посты первыми.
+
+    Годится для баз без полнотекстового поиска и как образец
+    для других бэкендов.
+    """
+
+    # Ключ сортировки найденного, он же ключ keyset-пагинации
+    keys = ('-created', '-id')
+
+    def index(self, post):
+        """Добавляет пост в индекс или обновляет его текст."""
+
+    def remove(self, post_id):
+        """Убирает пост из индекса."""
+
+    def rebuild(self):
+        """Строит индекс заново по всем постам."""
+
+    def filter(self, queryset, query):
+        """Отбирает из ``queryset`` посты, подходящие под ``query``."""
+        return queryset.filter(text__icontains=query)
+
+    def search(self, queryset, query):
+        """То же, что ``filter``, но с порядком по ``keys``."""
+        return self.filter(queryset, query)
+
+
+class SQLiteFTSBackend(SearchBackend):
+    # bm25 отрицательный: чем меньше, тем точнее совпадение. В курсоре
+    # лежит сам ранг, и после записи в индекс он для того же поста уже
+    # другой: страницы по курсору - лучшее из возможного (см. выше)
+    keys = ('rank', '-id')
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, text) '
+                'VALUES (%s, %s)',
+                [post.pk, post.text],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                'SELECT id, text FROM posts_post'
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+    def match(self, query):
+        """Запрос FTS5: все слова, каждое как префикс.
+
+        Слова берутся в кавычки, чтобы операторы FTS5 из строки
+        пользователя не ломали запрос.
+        """
+        return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+    def filter(self, queryset, query):
+        match = self.match(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [match],
+        ))
+
+    def search(self, queryset, query):
+        match = self.match(query)
+        if not match:
+            return queryset.annotate(
+                rank=Value(0.0, output_field=FloatField())).none()
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[
+                f'{FTS_TABLE}.rowid = {table}.id',
+                f'{FTS_TABLE} MATCH %s',
+            ],
+            params=[match],
+        ).annotate(
+            rank=RawSQL(f'bm25({FTS_TABLE})', (), output_field=FloatField()))
@@ -0,0 +1,177 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, search, thumbnails, timeline
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+# Поля пользователя, которые видны на страницах с его постами
+SHOWN_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _shown_names(user):
+    return tuple(getattr(user, name) for name in SHOWN_USER_FIELDS)
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_user_names(sender, instance, update_fields=None, **kwargs):
+    # Вход, смена пароля и прав на страницах не видны: без чтения
+    # прежнего имени обходятся сохранения, которые его не трогают
+    instance._old_names = None
+    if instance._state.adding or (
+            update_fields is not None
+            and not set(update_fields) & set(SHOWN_USER_FIELDS)):
+        return
+    instance._old_names = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list(*SHOWN_USER_FIELDS)
+        .first()
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def bump_user_pages(sender, instance, created, **kwargs):
+    # Имя автора есть на всех страницах с его постами
+    old_names = getattr(instance, '_old_names', None)
+    if created or old_names is None:
+        return
+    if old_names != _shown_names(instance):
+        caching.bump_all()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, **kwargs):
+    # Группу до правки нужно знать, чтобы перенести счётчик постов,
+    # а картинку - чтобы перестроить превью
+    instance._old_group_id = instance.group_id
+    instance._image_changed = bool(instance.image)
+    if not instance._state.adding:
+        previous = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image')
+            .first()
+        )
+        if previous is not None:
+            instance._old_group_id = previous[0]
+            instance._image_changed = previous[1] != instance.image.name
+    if instance._image_changed:
+        instance.thumbnail = ''
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_pages(sender, instance, **kwargs):
+    # Стоит до count_post: ему ещё нужна группа до правки
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    caching.bump(*caching.post_page_keys(
+        instance.pk, instance.author_id, (instance.group_id, old_group_id)))
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out.delay(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'posts_count', 1)
+        counters.change_group(instance.group_id, 1)
+        return
+    old_group_id = getattr(instance, '_old_group_id', instance.group_id)
+    if old_group_id != instance.group_id:
+        counters.change_group(old_group_id, -1)
+        counters.change_group(instance.group_id, 1)
+    instance._old_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, **kwargs):
+    if instance.image and getattr(instance, '_image_changed', False):
+        thumbnails.schedule(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'text' in update_fields:
+        search.get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.get_backend().remove(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'posts_count', -1)
+    counters.change_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_post(sender, instance, **kwargs):
+    caching.bump(caching.post_key(instance.post_id))
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follow_profiles(sender, instance, **kwargs):
+    # Подписка меняет счётчики и кнопку на профилях обоих пользователей
+    usernames = User.objects.filter(
+        id__in=(instance.user_id, instance.author_id)
+    ).values_list('username', flat=True)
+    caching.bump(*(caching.author_key(username) for username in usernames))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_pages(sender, **kwargs):
+    # Группа видна на всех страницах её постов, а правят группы редко
+    caching.bump_all()
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.drop(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'followers_count', -1)
+    counters.change_user(instance.user_id, 'following_count', -1)
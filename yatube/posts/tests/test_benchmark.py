@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from ..management.commands.benchmark import percentile
+from ..models import Comment, Follow, Group, Post, TimelineEntry, UserStats
+
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateDataTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'generate_data', users=30, groups=3, posts=120, comments=200,
+            follows=5, images=0.5, stdout=StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_volumes(self):
+        """Команда создаёт заказанное число объектов"""
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 120)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(Post.objects.exclude(image='').exists())
+
+    def test_derived_data(self):
+        """Счётчики, ленты подписок и даты постов согласованы с данными"""
+        for stats in UserStats.objects.all():
+            self.assertEqual(
+                stats.posts_count,
+                Post.objects.filter(author_id=stats.user_id).count())
+        follow = Follow.objects.filter(author__posts__isnull=False).first()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follow.user, author=follow.author).exists())
+        dates = list(
+            Post.objects.order_by('id').values_list('created', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        self.assertLess(dates[0], dates[-1])
+
+    def test_batch_over_backend_limit(self):
+        """--batch-size больше, чем SQLite принимает в одном INSERT"""
+        call_command(
+            'generate_data', users=5, groups=1, posts=600, comments=0,
+            follows=0, images=0, batch_size=1000, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 720)
+
+    def test_power_law(self):
+        """Подписчики распределены неравномерно: у лидера их больше всех"""
+        followers = sorted(
+            UserStats.objects.values_list('followers_count', flat=True),
+            reverse=True,
+        )
+        self.assertGreater(followers[0], followers[len(followers) // 2])
+
+    def test_benchmark(self):
+        """Бенчмарк выводит перцентили по всем страницам и сверяет базу"""
+        out = StringIO()
+        baseline = os.path.join(TEMP_MEDIA_ROOT, 'baseline.json')
+        call_command(
+            'benchmark', requests=3, warmup=1, save=baseline, stdout=out)
+        for name in (
+                'index', 'group_posts', 'profile', 'post_detail',
+                'follow_index'):
+            with self.subTest(name=name):
+                self.assertIn(name, out.getvalue())
+        with open(baseline) as saved:
+            results = json.load(saved)
+        # Главная после прогрева отдаётся из кеша без запросов,
+        # лента подписок своя у каждого и читается всегда
+        self.assertGreater(results['follow_index']['queries_max'], 0)
+        for result in results.values():
+            result['queries_max'] = 0
+        with open(baseline, 'w') as saved:
+            json.dump(results, saved)
+        with self.assertRaisesMessage(CommandError, 'Регрессия'):
+            call_command(
+                'benchmark', requests=3, warmup=0, baseline=baseline,
+                stdout=StringIO())
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 50), 0.0)
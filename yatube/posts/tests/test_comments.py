@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+from ..models import Comment, Post
+from ..views import COMMENTS_PER_PAGE
+
+
+User = get_user_model()
+
+
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.post = Post.objects.create(text='test_text', author=cls.user)
+        cls.empty_post = Post.objects.create(text='empty', author=cls.user)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'comment{i}')
+            for i in range(COMMENTS_PER_PAGE + 5)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest = Client()
+        self.detail_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id})
+        self.comments_url = reverse(
+            'posts:post_comments', kwargs={'post_id': self.post.id})
+
+    def texts(self, comments):
+        return [comment.text for comment in comments]
+
+    def test_first_page_on_detail(self):
+        """Под постом только первая пачка комментариев и ссылка на ещё"""
+        response = self.guest.get(self.detail_url)
+        comments = response.context['comments']
+        self.assertEqual(
+            self.texts(comments),
+            [f'comment{i}' for i in range(COMMENTS_PER_PAGE)])
+        self.assertContains(
+            response, f'{self.comments_url}?cursor={comments.next_cursor}')
+
+    def test_fragment_html(self):
+        """Фрагмент догружает оставшиеся комментарии без ссылки на ещё"""
+        first = self.guest.get(self.detail_url).context['comments']
+        response = self.guest.get(
+            self.comments_url, {'cursor': first.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(
+            self.texts(response.context['comments']),
+            [f'comment{i}' for i in range(COMMENTS_PER_PAGE, 25)])
+        self.assertNotContains(response, 'data-fragment')
+
+    def test_fragment_json(self):
+        """JSON отдаёт пачку комментариев с авторами и курсор дальше"""
+        response = self.guest.get(self.comments_url, {'format': 'json'})
+        data = response.json()
+        self.assertEqual(len(data['comments']), COMMENTS_PER_PAGE)
+        self.assertEqual(data['comments'][0]['author'], 'test_user')
+        self.assertEqual(data['comments'][0]['text'], 'comment0')
+        data = self.guest.get(
+            self.comments_url,
+            {'format': 'json', 'cursor': data['next_cursor']}).json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_not_modified(self):
+        """Повторный запрос фрагмента получает 304, пока нет новых"""
+        response = self.guest.get(self.comments_url)
+        etag = response['ETag']
+        response = self.guest.get(self.comments_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=self.post, author=self.user, text='new')
+        response = self.guest.get(self.comments_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_post(self):
+        """Пост без комментариев отдаёт пустую пачку, чужой id - 404"""
+        response = self.guest.get(reverse(
+            'posts:post_comments', kwargs={'post_id': self.empty_post.id}))
+        self.assertEqual(response.status_code, 200)
+        response = self.guest.get(reverse(
+            'posts:post_comments', kwargs={'post_id': 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,134 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, Client
+from django.urls import reverse
+from .. import caching
+from ..models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test_group',
+            slug='test_group',
+            description='test everythink'
+        )
+        cls.post = Post.objects.create(
+            text='test_text', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authenticated_user = Client()
+        self.authenticated_user.force_login(ConditionalGetTest.reader)
+        self.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse('posts:current_post', args=[self.group.slug]),
+            'profile': reverse('posts:profile', args=[self.user.username]),
+            'post': reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.id}),
+        }
+
+    def test_not_modified(self):
+        """Неизменившаяся страница отдаётся ответом 304 без запросов"""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.guest_client.get(url)
+                self.assertIn('Last-Modified', response)
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                response = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_user(self):
+        """У гостя и пользователя разные ETag, дата - только у гостя"""
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                guest = self.guest_client.get(url)
+                user = self.authenticated_user.get(url)
+                self.assertNotEqual(guest['ETag'], user['ETag'])
+                self.assertNotIn('Last-Modified', user)
+                response = self.authenticated_user.get(
+                    url, HTTP_IF_NONE_MATCH=guest['ETag'])
+                self.assertEqual(response.status_code, 200)
+
+    def assertModified(self, change, *names):
+        etags = {
+            name: self.guest_client.get(url)['ETag']
+            for name, url in self.urls.items()
+        }
+        change()
+        for name in names:
+            with self.subTest(page=name):
+                response = self.guest_client.get(
+                    self.urls[name], HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 200)
+
+    def test_new_post(self):
+        """Новый пост меняет ленту, группу, профиль и счётчик на посте"""
+        self.assertModified(
+            lambda: Post.objects.create(
+                text='new_text', author=self.user, group=self.group),
+            'index', 'group', 'profile', 'post',
+        )
+
+    def test_comment(self):
+        """Комментарий меняет страницу поста"""
+        self.assertModified(
+            lambda: Comment.objects.create(
+                text='comment', post=self.post, author=self.reader),
+            'post',
+        )
+
+    def test_follow(self):
+        """Подписка меняет профиль автора"""
+        self.assertModified(
+            lambda: Follow.objects.create(user=self.reader, author=self.user),
+            'profile',
+        )
+
+    def test_group_edit(self):
+        """Правка группы меняет все страницы с её постами"""
+        def rename():
+            self.group.title = 'new_title'
+            self.group.save()
+        self.assertModified(rename, 'index', 'group', 'profile', 'post')
+
+    def test_unrelated_changes(self):
+        """Комментарий к посту не меняет ленту, группу и профиль"""
+        etags = {
+            name: self.guest_client.get(url)['ETag']
+            for name, url in self.urls.items()
+        }
+        Comment.objects.create(
+            text='comment', post=self.post, author=self.reader)
+        for name in ('index', 'group', 'profile'):
+            with self.subTest(page=name):
+                response = self.guest_client.get(
+                    self.urls[name], HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 304)
+
+
+class CommitVersionTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='test_user')
+
+    def test_bump_after_commit(self):
+        """После коммита записи версия ленты поднимается ещё раз"""
+        with transaction.atomic():
+            Post.objects.create(text='test_text', author=self.user)
+            # Читатель до коммита кеширует старую ленту под этой версией
+            before_commit = caching.feed_version()
+        self.assertGreater(caching.feed_version(), before_commit)
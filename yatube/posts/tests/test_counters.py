@@ -0,0 +1,101 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from ..models import Comment, Follow, Group, Post, UserStats
+
+
+User = get_user_model()
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test_group',
+            slug='test_group',
+            description='test everythink'
+        )
+        cls.other_group = Group.objects.create(
+            title='other_group',
+            slug='other_group',
+            description='test everythink'
+        )
+
+    def setUp(self):
+        self.authenticated_user = Client()
+        self.authenticated_user.force_login(CountersTest.user)
+        self.reader = Client()
+        self.reader.force_login(CountersTest.reader)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление поста меняют счётчики"""
+        self.authenticated_user.post(
+            reverse('posts:post_create'),
+            {'text': 'test_text', 'group': CountersTest.group.id}
+        )
+        post = Post.objects.get(text='test_text')
+        self.assertEqual(self.stats(CountersTest.user).posts_count, 1)
+        self.authenticated_user.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            {'text': 'test_text', 'group': CountersTest.other_group.id}
+        )
+        CountersTest.group.refresh_from_db()
+        CountersTest.other_group.refresh_from_db()
+        self.assertEqual(CountersTest.group.posts_count, 0)
+        self.assertEqual(CountersTest.other_group.posts_count, 1)
+        post.refresh_from_db()
+        post.delete()
+        CountersTest.other_group.refresh_from_db()
+        self.assertEqual(self.stats(CountersTest.user).posts_count, 0)
+        self.assertEqual(CountersTest.other_group.posts_count, 0)
+
+    def test_comment_and_follow_counters(self):
+        """Комментарии и подписки меняют счётчики"""
+        post = Post.objects.create(text='test', author=CountersTest.user)
+        self.reader.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            {'text': 'comment'}
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.reader.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'test_user'}))
+        self.assertEqual(self.stats(CountersTest.user).followers_count, 1)
+        self.assertEqual(self.stats(CountersTest.reader).following_count, 1)
+        self.reader.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'test_user'}))
+        self.assertEqual(self.stats(CountersTest.user).followers_count, 0)
+        self.assertEqual(self.stats(CountersTest.reader).following_count, 0)
+
+    def test_recount_command(self):
+        """Команда recount_counters исправляет разошедшиеся счётчики"""
+        post = Post.objects.create(
+            text='test', author=CountersTest.user, group=CountersTest.group)
+        Comment.objects.create(
+            post=post, author=CountersTest.reader, text='comment')
+        Follow.objects.create(
+            user=CountersTest.reader, author=CountersTest.user)
+        UserStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7)
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=7)
+        UserStats.objects.filter(user=CountersTest.reader).delete()
+        call_command('recount_counters', stdout=StringIO())
+        author_stats = self.stats(CountersTest.user)
+        reader_stats = self.stats(CountersTest.reader)
+        post.refresh_from_db()
+        CountersTest.group.refresh_from_db()
+        self.assertEqual(
+            (author_stats.posts_count, author_stats.followers_count), (1, 1))
+        self.assertEqual(reader_stats.following_count, 1)
+        self.assertEqual(CountersTest.group.posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
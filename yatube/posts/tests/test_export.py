@@ -0,0 +1,116 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.query_budget import query_budget
+from ..export import rows
+from ..models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.author = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(
+            username='staff', is_staff=True)
+        cls.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+        cls.posts = Post.objects.bulk_create(
+            Post(text=f'пост {i}', author=cls.author, group=cls.group)
+            for i in range(7)
+        )
+        cls.post = Post.objects.order_by('pk').first()
+        Comment.objects.create(
+            post=cls.post, author=cls.user, text='комментарий, "цитата"')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.staff_client = Client()
+        self.staff_client.force_login(ExportTest.staff)
+        self.user_client = Client()
+        self.user_client.force_login(ExportTest.user)
+
+    def url(self, name, export_format):
+        return reverse('posts:export_data', kwargs={
+            'name': name, 'export_format': export_format})
+
+    def test_keyset_batches(self):
+        """Таблица читается пачками по первичному ключу"""
+        with CaptureQueriesContext(connection) as queries:
+            ids = [row[0] for row in rows('posts', batch_size=3)]
+        expected = Post.objects.order_by('pk').values_list('pk', flat=True)
+        self.assertEqual(ids, list(expected))
+        # 7 строк пачками по 3: 3 + 3 + 1, без OFFSET
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('OFFSET', queries[-1]['sql'])
+        self.assertIn('"id" >', queries[-1]['sql'])
+
+    def test_ndjson(self):
+        """NDJSON: объект на строку, даты в ISO 8601"""
+        response = self.staff_client.get(self.url('posts', 'ndjson'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 7)
+        first = json.loads(lines[0])
+        self.assertEqual(first['id'], self.post.pk)
+        self.assertEqual(first['author_id'], self.author.pk)
+        self.assertEqual(first['group_id'], self.group.pk)
+        self.assertEqual(first['created'], self.post.created.isoformat())
+
+    def test_csv(self):
+        """CSV с заголовком и экранированием"""
+        response = self.staff_client.get(self.url('comments', 'csv'))
+        self.assertIn(
+            'attachment; filename="comments.csv"',
+            response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode()
+        table = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(
+            table[0], ['id', 'created', 'post_id', 'author_id', 'text'])
+        self.assertEqual(table[1][4], 'комментарий, "цитата"')
+
+    def test_query_budget(self):
+        """Выгрузка в одну пачку - один запрос к таблице"""
+        for name in ('posts', 'comments', 'follows', 'groups'):
+            with self.subTest(name=name):
+                with query_budget('posts:export_data', authenticated=True):
+                    response = self.staff_client.get(self.url(name, 'csv'))
+                    content = b''.join(response.streaming_content)
+                self.assertTrue(content)
+
+    def test_staff_only(self):
+        """Выгрузка только для персонала"""
+        for client in (Client(), self.user_client):
+            with self.subTest(client=client):
+                response = client.get(self.url('posts', 'csv'))
+                self.assertEqual(response.status_code, 302)
+
+    def test_unknown(self):
+        """Неизвестные таблица и формат - 404"""
+        for name, export_format in (('users', 'csv'), ('posts', 'xml')):
+            with self.subTest(name=name, export_format=export_format):
+                response = self.staff_client.get(
+                    self.url(name, export_format))
+                self.assertEqual(response.status_code, 404)
+
+    def test_command(self):
+        """Команда export_data пишет выгрузку в стандартный вывод"""
+        out = io.StringIO()
+        call_command('export_data', 'follows', stdout=out)
+        self.assertEqual(
+            json.loads(out.getvalue()),
+            {'id': Follow.objects.get().pk, 'user_id': self.user.pk,
+             'author_id': self.author.pk})
@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from ..bulk import insert
+from ..models import Comment, Group, Post, UserStats
+from ..search import get_backend
+
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportDataTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        with open(os.path.join(cls.source, 'old.gif'), 'wb') as image:
+            image.write(SMALL_GIF)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(cls.source, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(
+            title='Группа', slug='test_slug', description='Описание')
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(content)
+        return path
+
+    def import_data(self, **options):
+        call_command(
+            'import_data', media_source=self.source, batch_size=2,
+            stdout=StringIO(), **options)
+
+    def test_import(self):
+        """Посты и комментарии загружаются пачками с датами и картинками,
+        производные данные пересчитываются в конце"""
+        posts = self.write('posts.ndjson', ''.join(
+            json.dumps(row) + '\n' for row in [
+                {'id': 10, 'author': 'author', 'group': 'test_slug',
+                 'text': 'Старый пост про котиков',
+                 'created': '2015-03-01T12:00:00', 'image': 'old.gif'},
+                {'id': 11, 'author': 'newcomer', 'group': 'new_group',
+                 'text': 'Второй пост'},
+                {'id': 12, 'author': 'author', 'text': 'Третий пост'},
+            ]))
+        comments = self.write(
+            'comments.csv',
+            'post,author,text,created\n'
+            '10,newcomer,"Первый, с запятой",2015-03-02 08:00:00\n'
+            '10,author,Второй,\n'
+            '11,author,Третий,\n'
+            '99,author,К посту не из файла,\n')
+        self.import_data(posts=posts, comments=comments)
+        self.assertEqual(Post.objects.count(), 3)
+        old = Post.objects.get(text='Старый пост про котиков')
+        self.assertEqual(
+            old.created,
+            timezone.make_aware(datetime(2015, 3, 1, 12)))
+        self.assertEqual(old.group, self.group)
+        self.assertTrue(old.image.name.startswith('posts/old'))
+        self.assertTrue(old.image.storage.exists(old.image.name))
+        newcomer = User.objects.get(username='newcomer')
+        self.assertFalse(newcomer.has_usable_password())
+        self.assertTrue(Group.objects.filter(slug='new_group').exists())
+        self.assertEqual(Comment.objects.count(), 3)
+        self.assertEqual(
+            Comment.objects.get(author=newcomer).text, 'Первый, с запятой')
+        # Счётчики, поиск и статистика новых авторов
+        old.refresh_from_db()
+        self.assertEqual(old.comments_count, 2)
+        self.assertEqual(UserStats.objects.get(user=newcomer).posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 2)
+        self.assertEqual(
+            list(get_backend().search(Post.objects.all(), 'котиков')),
+            [old])
+
+    def test_batch_over_backend_limit(self):
+        """Пачка больше, чем SQLite принимает в одном INSERT"""
+        ids = insert(Group, [
+            Group(title=str(i), slug=f'group-{i}', description='')
+            for i in range(600)
+        ], batch_size=1000)
+        self.assertEqual(len(ids), 600)
+
+    def test_requires_posts(self):
+        with self.assertRaisesMessage(CommandError, '--posts'):
+            self.import_data()
+
+    def test_bad_date(self):
+        posts = self.write('bad.ndjson', json.dumps(
+            {'author': 'author', 'text': 'x', 'created': 'вчера'}))
+        with self.assertRaisesMessage(CommandError, 'Неверная дата'):
+            self.import_data(posts=posts)
@@ -0,0 +1,120 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from core.paginator import CursorPaginator
+from .. import timeline
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+from ..views import COMMENT_KEYS
+
+
+User = get_user_model()
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='test_group',
+            slug='test_group',
+            description='test everythink'
+        )
+        cls.post = Post.objects.create(
+            text='test_text',
+            author=cls.user,
+            group=cls.group
+        )
+        # По несколько страниц в каждой ленте, чтобы был курсор дальше
+        Post.objects.bulk_create(
+            Post(text=f'post{i}', author=cls.user, group=cls.group)
+            for i in range(25)
+        )
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.reader, text=f'comment{i}')
+            for i in range(25)
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        timeline.rebuild()
+
+    def assertIndexed(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            # SCAN без индекса - полный просмотр таблицы
+            full_scans = [
+                line for line in plan.splitlines()
+                if ' SCAN ' in line and ' INDEX ' not in line
+            ]
+            self.assertEqual(full_scans, [], plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def assertKeysetIndexed(self, paginator, table):
+        """Страница по курсору - поиск диапазона в составном индексе,
+        без полного просмотра, объединения OR и сортировки."""
+        cursor = paginator.get_cursor_page().next_cursor
+        self.assertIsNotNone(cursor)
+        with CaptureQueriesContext(connection) as queries:
+            paginator.get_cursor_page(cursor)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute('EXPLAIN QUERY PLAN ' + queries[-1]['sql'])
+            plan = '\n'.join(row[-1] for row in db_cursor.fetchall())
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('MULTI-INDEX OR', plan)
+        self.assertNotRegex(plan, r'(^|\n)SCAN ')
+        self.assertRegex(
+            plan,
+            rf'SEARCH {table} USING (COVERING )?INDEX \S+ '
+            r'\((\w+=\? AND )?created[<>]\?\)')
+
+    def test_keyset_plans(self):
+        """Глубокие страницы лент стоят столько же, сколько первая"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Планы запросов SQLite')
+        feeds = {
+            'index': (Post.objects.for_feed(), ('-created', '-id')),
+            'group': (
+                Post.objects.for_feed().filter(group=self.group),
+                ('-created', '-id')),
+            'profile': (
+                Post.objects.for_feed().filter(author=self.user),
+                ('-created', '-id')),
+            'comments': (
+                Comment.objects.filter(post=self.post).order_by(
+                    *COMMENT_KEYS),
+                COMMENT_KEYS),
+            'timeline': (
+                timeline.follow_feed(self.follower),
+                ('-created', '-post_id')),
+        }
+        for name, (queryset, keys) in feeds.items():
+            with self.subTest(feed=name):
+                self.assertKeysetIndexed(
+                    CursorPaginator(queryset, 10, keys=keys),
+                    re.escape(queryset.model._meta.db_table))
+
+    def test_feed_plans(self):
+        """Запросы лент идут по индексам без полного просмотра и сортировки"""
+        feeds = {
+            'index': Post.objects.for_feed(),
+            'group': Post.objects.for_feed().filter(group=self.group),
+            'profile': Post.objects.for_feed().filter(author=self.user),
+            'comments': Comment.objects.filter(
+                post=self.post).order_by('created'),
+            'follow': Follow.objects.filter(
+                user=self.reader, author=self.user),
+            'timeline': TimelineEntry.objects.filter(user=self.reader),
+        }
+        for name, queryset in feeds.items():
+            with self.subTest(feed=name):
+                self.assertIndexed(queryset[:11])
+
+    def test_unique_follow(self):
+        """Подписаться на автора дважды нельзя"""
+        Follow.objects.create(user=self.reader, author=self.user)
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=self.reader, author=self.user)
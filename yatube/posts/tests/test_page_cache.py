@@ -0,0 +1,129 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Follow, Group, Post
+
+
+User = get_user_model()
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60)
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test_group',
+            slug='test_group',
+            description='test everythink'
+        )
+        cls.post = Post.objects.create(
+            text='test_text', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authenticated_user = Client()
+        self.authenticated_user.force_login(PageCacheTest.user)
+        self.reader_client = Client()
+        self.reader_client.force_login(PageCacheTest.reader)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:current_post', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+
+    def test_cached_for_guests(self):
+        """Повторный запрос гостя не ходит в базу"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.guest_client.get(url)
+                self.assertEqual(first.content, second.content)
+                self.assertNotContains(second, '<!--hole:')
+
+    def test_key_params(self):
+        """Ключ страницы - путь и её параметры в постоянном порядке"""
+        url = reverse('posts:current_post', args=[self.group.slug])
+        self.guest_client.get(url, {'page': 2, 'q': 'text'})
+        for params in (
+                {'q': 'text', 'page': 2},
+                {'page': 2, 'q': 'text', 'utm_source': 'mail'}):
+            with self.subTest(params=params):
+                with self.assertNumQueries(0):
+                    self.guest_client.get(url, params)
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(url, {'page': 3, 'q': 'text'})
+        self.assertTrue(queries)
+
+    def test_holes_for_users(self):
+        """Пользователь получает страницу гостя со своей шапкой и кнопками"""
+        post_url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id})
+        self.guest_client.get(post_url)
+        response = self.authenticated_user.get(post_url)
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(response, 'Пользователь: test_user')
+        self.assertContains(response, 'Редактировать')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(
+            response,
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}))
+        response = self.guest_client.get(post_url)
+        self.assertNotContains(response, 'Пользователь:')
+        self.assertNotContains(response, 'Добавить комментарий')
+
+    def test_switcher(self):
+        """Вкладки лент видит вошедший читатель, кто бы ни заполнил кеш"""
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        self.assertContains(
+            self.authenticated_user.get(url), 'Избранные авторы')
+        cache.clear()
+        self.authenticated_user.get(url)
+        self.assertNotContains(self.guest_client.get(url), 'Избранные авторы')
+
+    def test_follow_button(self):
+        """Кнопка подписки рендерится для каждого читателя"""
+        profile_url = reverse('posts:profile', args=[self.user.username])
+        self.guest_client.get(profile_url)
+        response = self.reader_client.get(profile_url)
+        self.assertContains(response, 'Подписаться')
+        Follow.objects.create(user=self.reader, author=self.user)
+        response = self.reader_client.get(profile_url)
+        self.assertContains(response, 'Отписаться')
+
+    def test_write_invalidates(self):
+        """Новый пост виден сразу, без ожидания кеша"""
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.create(text='fresh_text', author=self.user)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'fresh_text')
+
+    def test_user_save(self):
+        """Кеш сбрасывает только смена имени, которое видно на страницах"""
+        url = reverse('posts:profile', args=[self.user.username])
+        self.guest_client.get(url)
+        self.user.set_password('new_password')
+        self.user.save()
+        with self.assertNumQueries(0):
+            self.guest_client.get(url)
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self.assertContains(self.guest_client.get(url), 'Лев')
+
+    def test_errors_not_cached(self):
+        """Страница 404 рендерится целиком и не кешируется"""
+        url = reverse('posts:profile', args=['nobody'])
+        for _ in range(2):
+            response = self.guest_client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertNotContains(
+                response, '<!--hole:', status_code=404)
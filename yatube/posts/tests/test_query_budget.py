@@ -0,0 +1,123 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+from core.query_budget import QueryBudgetExceeded, query_budget
+from ..models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+
+class PostsQueryBudgetTest(TestCase):
+    """Страницы постов укладываются в бюджет при 50+ постах"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', first_name='Имя', last_name='Фамилия')
+            for i in range(5)
+        ]
+        cls.user = cls.authors[0]
+        cls.reader = User.objects.create_user(username='reader')
+        cls.groups = [
+            Group.objects.create(
+                title=f'group{i}', slug=f'group{i}', description='test')
+            for i in range(3)
+        ]
+        # По сигналу на пост: счётчики, ленты и поиск остаются
+        # согласованными, как в настоящей базе
+        for i in range(60):
+            Post.objects.create(
+                text=f'Test_text {i}',
+                author=cls.authors[i % len(cls.authors)],
+                group=cls.groups[i % len(cls.groups)],
+            )
+        cls.post = Post.objects.filter(author=cls.user).first()
+        for i, author in enumerate(cls.authors * 10):
+            Comment.objects.create(
+                post=cls.post, author=author, text=f'comment{i}')
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest = Client()
+        self.authenticated_user = Client()
+        self.authenticated_user.force_login(PostsQueryBudgetTest.user)
+        self.reader = Client()
+        self.reader.force_login(PostsQueryBudgetTest.reader)
+
+    def test_guest_pages(self):
+        """Ленты, поиск и пост для гостя"""
+        pages = {
+            'posts:index': {},
+            'posts:current_post': {'slug': 'group0'},
+            'posts:group_list': {},
+            'posts:profile': {'username': self.user.username},
+            'posts:post_detail': {'post_id': self.post.id},
+            'posts:post_comments': {'post_id': self.post.id},
+        }
+        for url_name, kwargs in pages.items():
+            with self.subTest(url_name=url_name):
+                with query_budget(url_name):
+                    response = self.guest.get(reverse(url_name, kwargs=kwargs))
+                self.assertEqual(response.status_code, 200)
+        with query_budget('posts:post_search'):
+            response = self.guest.get(
+                reverse('posts:post_search'), {'q': 'Test_text'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_user_pages(self):
+        """Те же страницы и формы для вошедшего пользователя"""
+        pages = {
+            'posts:index': {},
+            'posts:profile': {'username': self.user.username},
+            'posts:post_detail': {'post_id': self.post.id},
+            'posts:post_create': {},
+            'posts:post_edit': {'post_id': self.post.id},
+        }
+        for url_name, kwargs in pages.items():
+            with self.subTest(url_name=url_name):
+                with query_budget(url_name, authenticated=True):
+                    response = self.authenticated_user.get(
+                        reverse(url_name, kwargs=kwargs))
+                self.assertEqual(response.status_code, 200)
+
+    @query_budget('posts:follow_index', authenticated=True)
+    def test_follow_index(self):
+        """Лента подписок на пятерых авторов"""
+        response = self.reader.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_writes(self):
+        """Создание, правка, комментарий и подписки"""
+        with query_budget('posts:post_create', 'POST', authenticated=True):
+            self.authenticated_user.post(
+                reverse('posts:post_create'),
+                {'text': 'new_text', 'group': self.groups[0].id})
+        post = Post.objects.get(text='new_text')
+        with query_budget('posts:post_edit', 'POST', authenticated=True):
+            self.authenticated_user.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.id}),
+                {'text': 'new_text', 'group': self.groups[1].id})
+        with query_budget('posts:add_comment', 'POST', authenticated=True):
+            self.reader.post(
+                reverse('posts:add_comment', kwargs={'post_id': post.id}),
+                {'text': 'new_comment'})
+        new_reader = Client()
+        new_reader.force_login(User.objects.create_user(username='new'))
+        kwargs = {'username': self.user.username}
+        with query_budget('posts:profile_follow', authenticated=True):
+            new_reader.get(reverse('posts:profile_follow', kwargs=kwargs))
+        with query_budget('posts:profile_unfollow', authenticated=True):
+            new_reader.get(reverse('posts:profile_unfollow', kwargs=kwargs))
+
+    def test_exceeded(self):
+        """Запрос сверх бюджета роняет тест со списком запросов"""
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'SELECT'):
+            with query_budget('posts:group_list'):
+                list(Post.objects.all())
+                list(Group.objects.all())
@@ -0,0 +1,89 @@
+from urllib.parse import quote
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client
+from django.urls import reverse
+from ..models import Post
+from ..views import POSTS_PER_PAGE
+
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        cls.rare = Post.objects.create(
+            text='Котики гуляют по крыше', author=cls.user)
+        cls.frequent = Post.objects.create(
+            text='Котик, котики и снова котики', author=cls.user)
+        cls.other = Post.objects.create(
+            text='Совсем другая запись', author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authenticated_user = Client()
+        self.authenticated_user.force_login(SearchTest.user)
+
+    def found(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:post_search'), {'q': query, **params})
+        return response, [post.id for post in response.context['page_obj']]
+
+    def test_ranked_results(self):
+        """Поиск находит посты по префиксу слова, лучшие совпадения первыми"""
+        response, found = self.found('КОТИК')
+        self.assertTemplateUsed(response, 'posts/includes/post_list.html')
+        self.assertEqual(found, [self.frequent.id, self.rare.id])
+        _, found = self.found('котики крыше')
+        self.assertEqual(found, [self.rare.id])
+
+    def test_empty_and_odd_queries(self):
+        """Пустой запрос и операторы FTS5 в запросе не ломают страницу"""
+        for query in ('', '   ', '"', 'NEAR(', '*', 'котики OR'):
+            with self.subTest(query=query):
+                response = self.guest_client.get(
+                    reverse('posts:post_search'), {'q': query})
+                self.assertEqual(response.status_code, 200)
+
+    def test_index_follows_edit_and_delete(self):
+        """Правка и удаление поста сразу видны в поиске"""
+        self.authenticated_user.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.other.id}),
+            {'text': 'Теперь и здесь котики'},
+        )
+        _, found = self.found('котики')
+        self.assertIn(self.other.id, found)
+        _, found = self.found('совсем')
+        self.assertEqual(found, [])
+        Post.objects.filter(pk=self.rare.pk).delete()
+        _, found = self.found('крыше')
+        self.assertEqual(found, [])
+
+    def test_pagination(self):
+        """Страницы найденного идут по курсору и сохраняют запрос"""
+        for number in range(POSTS_PER_PAGE + 3):
+            Post.objects.create(text=f'Пёсик номер {number}', author=self.user)
+        response, first = self.found('пёсик')
+        cursor = response.context['page_obj'].next_cursor
+        self.assertContains(
+            response, f'?q={quote("пёсик")}&cursor={cursor}')
+        _, second = self.found('пёсик', cursor=cursor)
+        self.assertEqual(len(first), POSTS_PER_PAGE)
+        self.assertEqual(len(second), 3)
+        self.assertFalse(set(first) & set(second))
+
+    def test_admin_search(self):
+        """Поиск в админке идёт через индекс"""
+        admin = Client()
+        admin.force_login(SearchTest.admin)
+        response = admin.get(
+            reverse('admin:posts_post_changelist'), {'q': 'крыше'})
+        self.assertEqual(
+            [post.id for post in response.context['cl'].result_list],
+            [self.rare.id],
+        )
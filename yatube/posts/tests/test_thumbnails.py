@@ -0,0 +1,216 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
+
+from .. import thumbnails
+from ..management.commands import warm_thumbnails
+from ..models import Post
+
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_ALWAYS_EAGER=True)
+class ThumbnailTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='test_user')
+        self.authenticated_user = Client()
+        self.authenticated_user.force_login(self.user)
+
+    def create_post(self, name='small.gif'):
+        self.authenticated_user.post(
+            reverse('posts:post_create'),
+            {
+                'text': 'test_text',
+                'image': SimpleUploadedFile(
+                    name=name, content=SMALL_GIF, content_type='image/gif'),
+            }
+        )
+        return Post.objects.get(text='test_text')
+
+    def test_thumbnail_on_create(self):
+        """Превью строится после сохранения поста, шаблон берёт ссылку"""
+        post = self.create_post()
+        self.assertTrue(post.thumbnail.startswith(settings.MEDIA_URL))
+        response = self.authenticated_user.get(reverse('posts:index'))
+        self.assertContains(response, post.thumbnail)
+        response = self.authenticated_user.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, post.thumbnail)
+
+    def test_thumbnail_on_edit(self):
+        """Новая картинка при правке получает новое превью"""
+        post = self.create_post()
+        self.authenticated_user.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            {
+                'text': 'test_text',
+                'image': SimpleUploadedFile(
+                    name='other.gif', content=SMALL_GIF,
+                    content_type='image/gif'),
+            }
+        )
+        edited = Post.objects.get(id=post.id)
+        self.assertTrue(edited.thumbnail)
+        self.assertNotEqual(edited.thumbnail, post.thumbnail)
+
+    def test_missing_image(self):
+        """Без файла картинки превью не строится, страница открывается"""
+        post = Post.objects.create(
+            text='test_text', author=self.user, image='posts/missing.gif')
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, '')
+        response = self.authenticated_user.get(reverse('posts:index'))
+        # Пока превью нет, оригинал только по ссылке, не в ленте
+        self.assertContains(response, f'href="{post.image.url}"')
+        self.assertNotContains(response, f'src="{post.image.url}"')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_ALWAYS_EAGER=True)
+class WarmThumbnailsTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        user = User.objects.create_user(username='test_user')
+        self.state_file = os.path.join(TEMP_MEDIA_ROOT, 'warm.json')
+        self.posts = []
+        for number in range(3):
+            # Файл кладётся в хранилище в обход сигналов, как при переносе
+            name = default_storage.save(
+                f'posts/warm_{number}.gif', ContentFile(SMALL_GIF))
+            post = Post.objects.create(text='test_text', author=user)
+            Post.objects.filter(pk=post.pk).update(image=name)
+            self.posts.append(post)
+
+    def tearDown(self):
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+    def warm(self, **options):
+        out = StringIO()
+        call_command(
+            'warm_thumbnails', processes=0, batch_size=2,
+            state_file=self.state_file, stdout=out, **options)
+        return out.getvalue()
+
+    def test_warm_all(self):
+        """Команда строит превью всех картинок и сообщает скорость"""
+        out = self.warm()
+        for post in self.posts:
+            post.refresh_from_db()
+            self.assertTrue(post.thumbnail.startswith(settings.MEDIA_URL))
+        self.assertIn('в секунду', out)
+        self.assertIn('для 3 картинок', out)
+
+    def test_resume(self):
+        """Прерванный запуск продолжается с последнего обработанного
+        поста, законченный - не оставляет состояния"""
+        last = self.posts[-1].pk
+        warm = warm_thumbnails._warm
+
+        def interrupt(item):
+            if item[0] == last:
+                raise KeyboardInterrupt
+            return warm(item)
+
+        with mock.patch.object(warm_thumbnails, '_warm', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.warm()
+        out = self.warm()
+        self.assertIn(f'после поста {self.posts[1].pk}', out)
+        self.assertIn('для 1 картинок', out)
+        self.assertFalse(os.path.exists(self.state_file))
+        out = self.warm()
+        self.assertNotIn('после поста', out)
+        self.assertIn('для 3 картинок', out)
+
+    def test_rebuild_deleted_thumbnails(self):
+        """Превью, удалённые вместе с media/cache, строятся заново"""
+        self.warm()
+        shutil.rmtree(os.path.join(TEMP_MEDIA_ROOT, 'cache'))
+        self.warm(restart=True)
+        for post in self.posts:
+            post.refresh_from_db()
+            name = post.thumbnail[len(settings.MEDIA_URL):]
+            self.assertTrue(default_storage.exists(name))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_ALWAYS_EAGER=True)
+class ThumbnailLookupTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='test_user')
+        self.names = []
+        for number in range(3):
+            # Превью есть в хранилище sorl, но не записано в пост -
+            # как у постов, загруженных до фонового построения превью
+            name = default_storage.save(
+                f'posts/lookup_{number}.gif', ContentFile(SMALL_GIF))
+            thumbnails.build(name)
+            post = Post.objects.create(text='test_text', author=user)
+            Post.objects.filter(pk=post.pk).update(image=name)
+            self.names.append(name)
+
+    def test_thumbnail_file(self):
+        """Имя файла превью совпадает с тем, что строит sorl"""
+        geometry, options = thumbnails.VARIANTS[thumbnails.FEED_VARIANT]
+        for name in self.names:
+            self.assertEqual(
+                thumbnails.thumbnail_file(name, geometry, options).name,
+                get_thumbnail(name, geometry, **options).name,
+            )
+
+    def test_attach_in_one_round_trip(self):
+        """Ссылки на превью страницы берутся одним запросом, потом из кеша"""
+        posts = list(Post.objects.for_feed())
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.attach(posts)
+        for post in posts:
+            self.assertTrue(post.thumbnail.startswith(settings.MEDIA_URL))
+        posts = list(Post.objects.for_feed())
+        with self.assertNumQueries(0):
+            thumbnails.attach(posts)
+        self.assertTrue(all(post.thumbnail for post in posts))
+
+    def test_feed_shows_stored_thumbnail(self):
+        """Лента выводит превью из хранилища вместо исходной картинки"""
+        response = self.client.get(reverse('posts:index'))
+        for post in response.context['page_obj']:
+            self.assertContains(response, post.thumbnail)
+            self.assertNotContains(response, post.image.url)
@@ -1,13 +1,19 @@
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django import forms
-from ..models import Follow, Post, Group, Comment
+from ..models import Follow, Post, Group, Comment, TimelineEntry
 from django.urls import reverse
 import tempfile
 import shutil
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import base64
+import json
+from core.paginator import CursorPaginator
+from .. import timeline
 
 
 User = get_user_model()
@@ -272,6 +278,168 @@ class ContextTest(TestCase):
         self.assertEqual(new_post, post_detail_post)
 
 
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+        Post.objects.bulk_create(
+            Post(text='Test_text' + str(i), author_id=cls.user.id)
+            for i in range(25)
+        )
+
+    def setUp(self):
+        self.guest = Client()
+
+    def test_cursor_walk(self):
+        """Проход по курсорам отдаёт все посты без повторов"""
+        expected = list(Post.objects.all())
+        seen = []
+        url = reverse('posts:index')
+        response = self.guest.get(url)
+        while True:
+            page_obj = response.context['page_obj']
+            seen.extend(page_obj.object_list)
+            if not page_obj.next_cursor:
+                break
+            response = self.guest.get(
+                url, {'cursor': page_obj.next_cursor})
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor(self):
+        """Курсор назад возвращает на предыдущую страницу"""
+        url = reverse('posts:index')
+        first = self.guest.get(url).context['page_obj']
+        second = self.guest.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        third = self.guest.get(
+            url, {'cursor': second.next_cursor}).context['page_obj']
+        back = self.guest.get(
+            url, {'cursor': third.previous_cursor}).context['page_obj']
+        self.assertEqual(back.object_list, second.object_list)
+        self.assertIsNone(first.previous_cursor)
+        self.assertIsNone(third.next_cursor)
+
+    def test_no_count_query(self):
+        """Страница ленты не выполняет COUNT(*)"""
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_cursor_page()
+        with CaptureQueriesContext(connection) as queries:
+            page_obj = paginator.get_cursor_page(first.next_cursor)
+            list(page_obj)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT(', queries[0]['sql'].upper())
+        self.assertNotIn('OFFSET', queries[0]['sql'].upper())
+
+    def test_broken_cursor(self):
+        """Испорченный курсор открывает первую страницу"""
+        response = self.guest.get(
+            reverse('posts:index'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(
+            response.context['page_obj'].object_list,
+            list(Post.objects.all()[:10])
+        )
+
+    def test_forged_cursor(self):
+        """Подделанный курсор открывает первую страницу, а не ошибку 500"""
+        payloads = (
+            ['next', [None, None]],
+            ['next', [[1], [2]]],
+            ['next', [{'a': 1}, 'x']],
+            ['next', [1, 2]],
+            ['next', [10 ** 30, 1]],
+            ['next', ['2021-01-01T00:00:00+00:00']],
+            [[1], [2]],
+            [{'a': 1}, 'x'],
+            [1, 2],
+        )
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'test_user'}),
+            reverse('api:index'),
+        )
+        first = [post.id for post in Post.objects.all()[:10]]
+        for payload in payloads:
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(payload).encode()).decode()
+            for url in urls:
+                with self.subTest(payload=payload, url=url):
+                    response = self.guest.get(url, {'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+                    if response.context:
+                        page = response.context['page_obj'].object_list
+                        ids = [post.id for post in page]
+                    else:
+                        ids = [
+                            post['id']
+                            for post in json.loads(response.content)['results']
+                        ]
+                    self.assertEqual(ids, first)
+
+    def test_huge_page_number(self):
+        """Номер страницы больше любого OFFSET не ломает ленту"""
+        response = self.guest.get(
+            reverse('posts:index'), {'page': '9' * 20})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['page_obj']), [])
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='test_user', first_name='Test', last_name='User')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='test_group',
+            slug='test_group',
+            description='test everythink'
+        )
+        Post.objects.bulk_create(
+            Post(text='Test_text' + str(i), author_id=cls.user.id,
+                 group=cls.group)
+            for i in range(15)
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest = Client()
+        self.reader = Client()
+        self.reader.force_login(FeedQueriesTest.reader)
+
+    def test_feed_queries(self):
+        """Число запросов ленты не зависит от числа постов на странице"""
+        # Сессия и пользователь дают ещё два запроса авторизованному
+        # клиенту; лента подписок ищет популярных авторов для догрузки.
+        lib = {
+            reverse('posts:index'): (self.guest, 1),
+            reverse('posts:current_post',
+                    kwargs={'slug': 'test_group'}): (self.guest, 2),
+            reverse('posts:profile',
+                    kwargs={'username': 'test_user'}): (self.guest, 2),
+            reverse('posts:follow_index'): (self.reader, 4),
+        }
+        for url, (client, queries) in lib.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    response = client.get(url)
+                self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_post_detail_queries(self):
+        """Пост, его автор, группа и комментарии читаются без N+1"""
+        post = Post.objects.first()
+        Comment.objects.bulk_create(
+            Comment(post=post, author=FeedQueriesTest.reader,
+                    text='comment' + str(i))
+            for i in range(5)
+        )
+        with self.assertNumQueries(2):
+            self.guest.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.id}))
+
+
 class CommentsTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -338,6 +506,7 @@ class CacheTest(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.authenticated_user = Client()
         self.authenticated_user.force_login(CacheTest.user)
 
@@ -345,13 +514,50 @@ class CacheTest(TestCase):
         """Проверка работы кеширования на главной странице"""
         response = self.authenticated_user.get(reverse('posts:index'))
         self.assertIn('test_text', str(response.content))
-        CacheTest.new_post.delete()
+        # Запись в обход модели не поднимает версию ленты:
+        # фрагмент остаётся в кеше до очистки
+        Post.objects.filter(id=CacheTest.new_post.id).update(text='changed')
         response = self.authenticated_user.get(reverse('posts:index'))
         self.assertIn('test_text', str(response.content))
         cache.clear()
         response = self.authenticated_user.get(reverse('posts:index'))
         self.assertNotIn('test_text', str(response.content))
 
+    def test_index_cache_invalidation(self):
+        """Удаление поста сразу обновляет закешированную главную"""
+        response = self.authenticated_user.get(reverse('posts:index'))
+        self.assertIn('test_text', str(response.content))
+        CacheTest.new_post.delete()
+        response = self.authenticated_user.get(reverse('posts:index'))
+        self.assertNotIn('test_text', str(response.content))
+
+    def test_index_fragment_hit_queries(self):
+        """Фрагмент из кеша отдаётся без запросов к ленте"""
+        url = reverse('posts:index')
+        self.authenticated_user.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authenticated_user.get(url)
+        self.assertIn('test_text', response.content.decode())
+        feed = [
+            query['sql'] for query in queries
+            if '"posts_post"' in query['sql']
+        ]
+        self.assertEqual(feed, [])
+
+    def test_index_cache_pages(self):
+        """Каждая страница главной кешируется отдельно"""
+        Post.objects.bulk_create(
+            Post(text='page_text' + str(i), author_id=CacheTest.user.id)
+            for i in range(15)
+        )
+        cache.clear()
+        url = reverse('posts:index')
+        first = self.authenticated_user.get(url)
+        second = self.authenticated_user.get(
+            url, {'cursor': first.context['page_obj'].next_cursor})
+        self.assertNotEqual(first.content, second.content)
+        self.assertIn('test_text', second.content.decode())
+
 
 class FollowTest(TestCase):
     @classmethod
@@ -432,3 +638,57 @@ class FollowTest(TestCase):
             FollowTest.new_post.text,
             str(unfollow_response.content)
         )
+
+    def test_new_post_fan_out(self):
+        """Новый пост попадает в материализованную ленту подписчика"""
+        Follow.objects.create(
+            user=FollowTest.second_user,
+            author=FollowTest.first_user
+        )
+        post = Post.objects.create(
+            text='fan_out_text',
+            author_id=FollowTest.first_user.id
+        )
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=FollowTest.second_user, post=post).exists())
+        response = self.second_user.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'].object_list)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_heavy_author_fan_out_on_read(self):
+        """Посты популярного автора догружаются в ленту при чтении"""
+        Follow.objects.create(
+            user=FollowTest.second_user,
+            author=FollowTest.first_user
+        )
+        post = Post.objects.create(
+            text='heavy_author_text',
+            author_id=FollowTest.first_user.id
+        )
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        response = self.second_user.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['page_obj'].object_list,
+            [post, FollowTest.new_post]
+        )
+
+    @override_settings(TIMELINE_BACKFILL_SIZE=2)
+    def test_rebuild_backfill_size(self):
+        """Пересборка лент берёт столько постов автора, сколько подписка"""
+        Follow.objects.create(
+            user=FollowTest.second_user,
+            author=FollowTest.first_user
+        )
+        posts = [
+            Post.objects.create(
+                text=f'rebuild_text{i}',
+                author_id=FollowTest.first_user.id
+            )
+            for i in range(3)
+        ]
+        timeline.rebuild()
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(
+                user=FollowTest.second_user).values_list('post', flat=True)),
+            [posts[2].id, posts[1].id]
+        )
@@ -0,0 +1,108 @@
+"""Превью картинок постов.
+
+Превью строятся задачей фоновой очереди ``thumbnails`` сразу после
+сохранения поста с новой картинкой, а не при первом рендеринге
+шаблона. Ссылка на превью ленты сохраняется в ``Post.thumbnail``,
+и шаблоны только читают её.
+Постам, у которых ссылки ещё нет, ``attach`` подставляет её из хранилища
+sorl за один поход на всю страницу.
+"""
+from django.core.files.storage import default_storage
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from core import metrics
+from core.tasks import task
+
+from . import caching
+from .models import Post
+
+# Варианты превью, которые выводят шаблоны: имя -> (геометрия, опции)
+VARIANTS = {
+    'feed': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Вариант, ссылка на который хранится в Post.thumbnail
+FEED_VARIANT = 'feed'
+
+
+def build(name, verify=False):
+    """Строит все варианты превью картинки. Возвращает их ссылки.
+
+    С ``verify=True`` проверяет, что файл превью на месте: после очистки
+    ``media/cache`` хранилище sorl ещё помнит удалённые превью.
+    """
+    urls = {}
+    with metrics.timed('thumbnail'):
+        for variant, (geometry, options) in VARIANTS.items():
+            thumbnail = get_thumbnail(name, geometry, **options)
+            if verify and not thumbnail.exists():
+                default.kvstore.delete(thumbnail)
+                thumbnail = get_thumbnail(name, geometry, **options)
+            urls[variant] = thumbnail.url
+    return urls
+
+
+def thumbnail_file(name, geometry, options):
+    """Файл превью, который построил бы ``get_thumbnail``, без чтения
+    картинки и без обращения к хранилищу.
+
+    Опции дополняются так же, как в ``ThumbnailBackend.get_thumbnail``,
+    иначе имя файла и ключ в хранилище не совпадут.
+    """
+    backend = default.backend
+    source = ImageFile(name)
+    options = dict(options)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(thumbnail_defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage,
+    )
+
+
+def attach(posts):
+    """Подставляет ссылку на превью ленты постам, у которых её нет.
+
+    Превью ищутся в хранилище sorl одним пакетным запросом и не строятся:
+    недостающие достроит очередь или команда ``warm_thumbnails``.
+    """
+    geometry, options = VARIANTS[FEED_VARIANT]
+    files = {
+        post: thumbnail_file(post.image.name, geometry, options)
+        for post in posts
+        if post.image and not post.thumbnail
+    }
+    if not files:
+        return
+    found = default.kvstore.get_many(files.values())
+    for post, image_file in files.items():
+        if image_file.key in found:
+            post.thumbnail = found[image_file.key].url
+
+
+@task(queue='thumbnails')
+def generate(post_id, name):
+    """Строит превью и записывает ссылку на превью ленты в пост."""
+    if not default_storage.exists(name):
+        return
+    urls = build(name)
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        thumbnail=urls[FEED_VARIANT])
+    if updated:
+        author_id, group_id = Post.objects.values_list(
+            'author_id', 'group_id').get(pk=post_id)
+        caching.bump(*caching.post_page_keys(
+            post_id, author_id, (group_id,)))
+
+
+def schedule(post):
+    """Ставит построение превью в очередь."""
+    generate.delay(post.pk, post.image.name)
@@ -0,0 +1,138 @@
+"""Материализованная лента подписок.
+
+Новый пост раскладывается по лентам подписчиков автора задачей фоновой
+очереди ``timeline`` (fan-out on write), поэтому лента читателя — это
+диапазон его собственных строк ``TimelineEntry``. У авторов, на которых
+подписано больше ``TIMELINE_FANOUT_LIMIT`` читателей, посты не
+раскладываются при записи: каждый читатель догружает их в свою ленту
+сам при открытии страницы подписок (fan-out on read).
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max, Q
+
+from core.tasks import task
+
+from .models import FEED_FIELDS, Follow, Post, TimelineEntry, UserStats
+
+
+def _entries(user_id, posts):
+    return [
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            created=post.created,
+        )
+        for post in posts
+    ]
+
+
+@task(queue='timeline')
+def fan_out(post_id):
+    """Добавляет пост в ленты подписчиков автора."""
+    post = Post.objects.filter(pk=post_id).only(
+        'id', 'author_id', 'created').first()
+    if post is None:
+        return
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    followers = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)[:limit + 1]
+    )
+    if len(followers) > limit:
+        return
+    TimelineEntry.objects.bulk_create(
+        [
+            entry
+            for follower in followers
+            for entry in _entries(follower, [post])
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту свежими постами автора после подписки."""
+    posts = Post.objects.filter(author_id=author_id).only(
+        'id', 'author_id', 'created')[:settings.TIMELINE_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        _entries(user_id, posts), ignore_conflicts=True)
+
+
+def drop(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def heavy_authors(user):
+    """Авторы из подписок, чьи посты не раскладываются при записи."""
+    return list(
+        UserStats.objects.filter(
+            user_id__in=Follow.objects.filter(user=user).values('author_id'),
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('user_id', flat=True)
+    )
+
+
+def catch_up(user):
+    """Догружает в ленту новые посты популярных авторов."""
+    authors = heavy_authors(user)
+    if not authors:
+        return
+    watermarks = dict(
+        TimelineEntry.objects.filter(user=user, author_id__in=authors)
+        .values('author_id')
+        .annotate(last=Max('created'))
+        .values_list('author_id', 'last')
+    )
+    condition = Q()
+    for author_id in authors:
+        step = Q(author_id=author_id)
+        if watermarks.get(author_id):
+            step &= Q(created__gt=watermarks[author_id])
+        condition |= step
+    posts = Post.objects.filter(condition).only(
+        'id', 'author_id', 'created')[:settings.TIMELINE_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        _entries(user.id, posts), ignore_conflicts=True)
+
+
+def follow_feed(user):
+    """Строки ленты читателя вместе с постами, авторами и группами."""
+    catch_up(user)
+    return (
+        TimelineEntry.objects.filter(user=user)
+        .select_related('post__author', 'post__group')
+        .only('created', *(f'post__{name}' for name in FEED_FIELDS))
+    )
+
+
+def rebuild():
+    """Раскладывает ленты заново по подпискам и постам.
+
+    Нужна после массовой записи в обход сигналов. Как и после подписки,
+    в ленту попадают только ``TIMELINE_BACKFILL_SIZE`` последних постов
+    каждого автора. Посты популярных авторов не раскладываются, как
+    и в ``fan_out``; перед вызовом счётчики подписчиков должны быть
+    актуальны.
+    """
+    TimelineEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {TimelineEntry._meta.db_table} '
+            '(user_id, post_id, author_id, created) '
+            'SELECT follow.user_id, post.id, post.author_id, post.created '
+            f'FROM {Follow._meta.db_table} follow '
+            'JOIN (SELECT id, author_id, created, ROW_NUMBER() OVER ('
+            'PARTITION BY author_id ORDER BY created DESC, id DESC'
+            f') AS position FROM {Post._meta.db_table}) post '
+            'ON post.author_id = follow.author_id '
+            f'JOIN {UserStats._meta.db_table} stats '
+            'ON stats.user_id = follow.author_id '
+            'WHERE stats.followers_count <= %s AND post.position <= %s',
+            [
+                settings.TIMELINE_FANOUT_LIMIT,
+                settings.TIMELINE_BACKFILL_SIZE,
+            ],
+        )
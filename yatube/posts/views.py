@@ -1,36 +1,54 @@
 from django.shortcuts import redirect
 from django.shortcuts import render, get_object_or_404
 from .models import Post, Group, Comment, Follow
-from django.core.paginator import Paginator
+from core.db_router import use_primary
+from core.paginator import CursorPaginator, get_page
 from django.contrib.auth.models import User
+from django.conf import settings
 from .forms import PostForm, CommentForm
+from . import caching, counters, export, search, thumbnails, timeline
 from datetime import datetime
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import IntegrityError, transaction
+from django.utils.functional import SimpleLazyObject
 
+# Показывать по 10 записей на странице.
+POSTS_PER_PAGE = 10
+# Комментарии показываются пачками от старых к новым
+COMMENTS_PER_PAGE = 20
+COMMENT_KEYS = ('created', 'id')
 
-def index(request):
-    # Показывать по 10 записей на странице.
-    paginator = Paginator(Post.objects.all(), 10)
 
-    # Из URL извлекаем номер запрошенной страницы - это значение параметра page
-    page_number = request.GET.get('page')
+@caching.cached_page(lambda request: [caching.FEED_VERSION_KEY])
+def index(request):
+    def feed_page():
+        # Страница выбирается по курсору из параметра cursor,
+        # без COUNT(*) и OFFSET
+        page_obj = get_page(
+            request, Post.objects.for_feed(), POSTS_PER_PAGE)
+        thumbnails.attach(page_obj)
+        return page_obj
 
-    # Получаем набор записей для страницы с запрошенным номером
-    page_obj = paginator.get_page(page_number)
-    # Отдаем в словаре контекста
+    # Фрагмент ленты кешируется по версии ленты, которую поднимает
+    # каждая запись поста. Страница читается, только когда фрагмент
+    # рендерится: при попадании в кеш запросов к ленте нет
     context = {
-        'page_obj': page_obj,
+        'page_obj': SimpleLazyObject(feed_page),
+        'feed_version': caching.feed_version(),
+        'cache_timeout': settings.INDEX_CACHE_TIMEOUT,
     }
     return render(request, 'posts/index.html', context)
 
 
+@caching.cached_page(lambda request, slug: [caching.group_key(slug)])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.for_feed().filter(group=group)
+    page_obj = get_page(request, posts, POSTS_PER_PAGE)
+    thumbnails.attach(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -38,36 +56,65 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+def post_search(request):
+    # Найденное сортируется по рангу бэкенда поиска, страницы -
+    # по курсору из того же ключа. Ранг bm25 меняется с каждой записью
+    # в индекс, поэтому следующая страница может немного сдвинуться
+    query = request.GET.get('q', '').strip()
+    backend = search.get_backend()
+    posts = backend.search(Post.objects.for_feed(), query)
+    if not query:
+        posts = posts.none()
+    page_obj = get_page(request, posts, POSTS_PER_PAGE, keys=backend.keys)
+    thumbnails.attach(page_obj)
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 def group_list(request):
     return render(request, 'posts/group_list.html')
 
 
+@caching.cached_page(
+    lambda request, username: [caching.author_key(username)])
 def profile(request, username):
     # Здесь код запроса к модели и создание словаря контекста
-    user = get_object_or_404(User, username=username)
-    paginator = Paginator(Post.objects.filter(author_id=user.id), 10)
-    page_number = request.GET.get('page')
-    user_posts = paginator.get_page(page_number)
-    user_posts_count = user.posts.count()
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    user_posts = get_page(
+        request, Post.objects.for_feed().filter(author_id=user.id),
+        POSTS_PER_PAGE)
+    thumbnails.attach(user_posts)
+    # Число постов берём из счётчика, а не из COUNT(*) по постам
+    stats = counters.user_stats(user)
     following = False
     if request.user.is_authenticated:
         if Follow.objects.filter(author=user, user=request.user).exists():
             following = True
     context = {
         'page_obj': user_posts,
-        'posts_count': user_posts_count,
+        'posts_count': stats.posts_count,
+        'stats': stats,
         'author': user,
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+# Число постов автора меняется только вместе с версией ленты
+@caching.cached_page(lambda request, post_id: [
+    caching.post_key(post_id), caching.FEED_VERSION_KEY])
 def post_detail(request, post_id):
     # Здесь код запроса к модели и создание словаря контекста
-    post = get_object_or_404(Post, id=post_id)
-    user_posts_count = post.author.posts.count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    thumbnails.attach([post])
+    user_posts_count = counters.user_stats(post.author).posts_count
     form = CommentForm()
-    comments = Comment.objects.filter(post=post_id)
+    comments = comments_page(request, post_id)
     context = {
         'post': post,
         'user_posts_count': user_posts_count,
@@ -77,6 +124,47 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_page(request, post_id):
+    """Пачка комментариев поста по курсору из ``?cursor=``."""
+    comments = (
+        Comment.objects.filter(post_id=post_id)
+        .select_related('author')
+        .only('created', 'text', 'post_id', 'author__username')
+        .order_by(*COMMENT_KEYS)
+    )
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, keys=COMMENT_KEYS)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+@caching.conditional(lambda request, post_id: [caching.post_key(post_id)])
+def post_comments(request, post_id):
+    # Следующая пачка комментариев для догрузки на странице поста:
+    # HTML-фрагмент или JSON при ?format=json
+    comments = comments_page(request, post_id)
+    if not comments and not Post.objects.filter(id=post_id).exists():
+        raise Http404
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.id,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next_cursor': comments.next_cursor,
+        })
+    context = {
+        'comments': comments,
+        'post_id': post_id,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+@use_primary
 @login_required
 def post_create(request):
     form = PostForm(
@@ -88,13 +176,15 @@ def post_create(request):
         author_id = request.user.id
         pub_date = datetime.now()
         files = form.cleaned_data['image']
-        Post.objects.create(
-            text=text,
-            group=group,
-            created=pub_date,
-            author_id=author_id,
-            image=files
-        )
+        # Пост и счётчики автора и группы пишутся одной транзакцией
+        with transaction.atomic():
+            Post.objects.create(
+                text=text,
+                group=group,
+                created=pub_date,
+                author_id=author_id,
+                image=files
+            )
         url = reverse(
             'posts:profile',
             kwargs={'username': request.user.username})
@@ -102,6 +192,7 @@ def post_create(request):
     return render(request, 'posts/post_create.html', {'form': form})
 
 
+@use_primary
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -120,7 +211,8 @@ def post_edit(request, post_id):
         post.text = text
         post.group = group
         post.image = image
-        post.save()
+        with transaction.atomic():
+            post.save()
         url = reverse('posts:post_detail', kwargs={'post_id': post_id})
         return redirect(url)
     return render(
@@ -129,6 +221,7 @@ def post_edit(request, post_id):
         {'form': form, 'is_edit': is_edit})
 
 
+@use_primary
 @login_required
 def add_comment(request, post_id):
     # Получите пост
@@ -138,44 +231,62 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
     # информация о текущем пользователе доступна в переменной request.user
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Лента читается из материализованной таблицы TimelineEntry
+    entries = timeline.follow_feed(request.user)
+    page_obj = get_page(
+        request, entries, POSTS_PER_PAGE, keys=('-created', '-post_id'))
+    page_obj.object_list = [entry.post for entry in page_obj]
+    thumbnails.attach(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/follow.html', context)
 
 
+@use_primary
 @login_required
 def profile_follow(request, username):
     # Подписаться на автора
     author = get_object_or_404(User, username=username)
     if author != request.user:
-        if not Follow.objects.filter(
-            user=request.user,
-                author=User.objects.get(username=username)).exists():
-            user = request.user
-            Follow.objects.create(
-                user=user,
-                author=author
-            )
+        # Повторную подписку отсекает уникальное ограничение в базе
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=request.user, author=author)
+        except IntegrityError:
+            pass
     return redirect(reverse('posts:follow_index'))
 
 
+@use_primary
 @login_required
 def profile_unfollow(request, username):
     # Дизлайк, отписка
     user = request.user
     author = get_object_or_404(User, username=username)
     follow = get_object_or_404(Follow, user=user, author=author)
-    follow.delete()
+    with transaction.atomic():
+        follow.delete()
     return redirect(reverse('posts:follow_index'))
+
+
+@staff_member_required
+def export_data(request, name, export_format):
+    # Выгрузка таблицы для аналитики: строки отдаются по мере чтения,
+    # без сборки всего ответа в памяти
+    if name not in export.EXPORTS or export_format not in export.FORMATS:
+        raise Http404
+    response = StreamingHttpResponse(
+        export.export(name, export_format),
+        content_type=export.FORMATS[export_format])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}.{export_format}"')
+    return response
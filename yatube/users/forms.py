@@ -1,5 +1,13 @@
 from django.contrib.auth import get_user_model
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
+from django.contrib.auth.tokens import default_token_generator
+from django.contrib.sites.shortcuts import get_current_site
+from django.template import loader
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from core.mail import send_email
+from core.tasks import task
 
 
 User = get_user_model()
@@ -10,3 +18,63 @@ class CreationForm(UserCreationForm):
 
         model = User
         fields = ('first_name', 'last_name', 'username', 'email')
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """Письмо со ссылкой на сброс пароля уходит через очередь."""
+
+    def save(self, domain_override=None,
+             subject_template_name='registration/password_reset_subject.txt',
+             email_template_name='registration/password_reset_email.html',
+             use_https=False, token_generator=default_token_generator,
+             from_email=None, request=None, html_email_template_name=None,
+             extra_email_context=None):
+        # В очередь уходят только id пользователя и имена шаблонов:
+        # токен выписывает воркер, и в таблице задач его нет.
+        # token_generator поэтому всегда стандартный
+        for user in self.get_users(self.cleaned_data['email']):
+            if domain_override:
+                site_name = domain = domain_override
+            else:
+                current_site = get_current_site(request)
+                site_name = current_site.name
+                domain = current_site.domain
+            send_password_reset.delay(
+                user.pk, domain, site_name, use_https,
+                subject_template_name, email_template_name,
+                from_email=from_email,
+                html_email_template_name=html_email_template_name,
+                extra_email_context=extra_email_context,
+            )
+
+
+@task(queue='email', max_attempts=5, sensitive=True)
+def send_password_reset(user_id, domain, site_name, use_https,
+                        subject_template_name, email_template_name,
+                        from_email=None, html_email_template_name=None,
+                        extra_email_context=None):
+    """Выписывает токен сброса пароля и отправляет письмо."""
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    # Пока задача ждала, пользователя могли отключить
+    if user is None or not user.has_usable_password():
+        return
+    email = getattr(user, User.get_email_field_name())
+    context = {
+        'email': email,
+        'domain': domain,
+        'site_name': site_name,
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'user': user,
+        'token': default_token_generator.make_token(user),
+        'protocol': 'https' if use_https else 'http',
+        **(extra_email_context or {}),
+    }
+    subject = loader.render_to_string(subject_template_name, context)
+    subject = ''.join(subject.splitlines())
+    body = loader.render_to_string(email_template_name, context)
+    html_body = None
+    if html_email_template_name is not None:
+        html_body = loader.render_to_string(
+            html_email_template_name, context)
+    # Уже в воркере: письмо отправляется сразу, без второй задачи
+    send_email(subject, body, from_email, [email], html_body)
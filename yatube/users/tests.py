@@ -0,0 +1,113 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from core import tasks
+from core.models import Task
+from core.query_budget import query_budget
+
+
+User = get_user_model()
+PASSWORD = 'Test_password_123'
+
+
+class UsersQueryBudgetTest(TestCase):
+    """Страницы регистрации, входа и смены пароля укладываются в бюджет"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='test_user', email='test@example.com',
+            password=PASSWORD)
+
+    def setUp(self):
+        cache.clear()
+        self.guest = Client()
+        self.authenticated_user = Client()
+        self.authenticated_user.force_login(UsersQueryBudgetTest.user)
+
+    def test_guest_pages(self):
+        """Формы для гостя"""
+        pages = {
+            'users:signup': {},
+            'users:login': {},
+            'users:password_reset_email': {},
+            'users:password_reset_done': {},
+            'users:password_reset_complete': {},
+            'users:password_reset_confirm': {
+                'uidb64': 'MQ', 'token': 'set-password'},
+        }
+        for url_name, kwargs in pages.items():
+            with self.subTest(url_name=url_name):
+                with query_budget(url_name):
+                    response = self.guest.get(reverse(url_name, kwargs=kwargs))
+                self.assertEqual(response.status_code, 200)
+
+    def test_user_pages(self):
+        """Смена пароля для вошедшего пользователя"""
+        for url_name in (
+                'users:password_change', 'users:password_change_done'):
+            with self.subTest(url_name=url_name):
+                with query_budget(url_name, authenticated=True):
+                    response = self.authenticated_user.get(reverse(url_name))
+                self.assertEqual(response.status_code, 200)
+
+    def test_writes(self):
+        """Регистрация, вход, смена и сброс пароля, выход"""
+        with query_budget('users:signup', 'POST'):
+            response = self.guest.post(reverse('users:signup'), {
+                'username': 'new_user',
+                'password1': PASSWORD,
+                'password2': PASSWORD,
+            })
+        self.assertRedirects(response, reverse('posts:index'))
+        with query_budget('users:login', 'POST'):
+            response = self.guest.post(reverse('users:login'), {
+                'username': 'new_user', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 302)
+        with query_budget('users:password_change', 'POST',
+                          authenticated=True):
+            response = self.guest.post(reverse('users:password_change'), {
+                'old_password': PASSWORD,
+                'new_password1': PASSWORD + '4',
+                'new_password2': PASSWORD + '4',
+            })
+        self.assertRedirects(response, reverse('users:password_change_done'))
+        with query_budget('users:password_reset_email', 'POST'):
+            Client().post(
+                reverse('users:password_reset_email'),
+                {'email': 'test@example.com'})
+        with query_budget('users:logout', authenticated=True):
+            response = self.guest.get(reverse('users:logout'))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(TASKS_ALWAYS_EAGER=False)
+class PasswordResetQueueTest(TestCase):
+    def test_email_queued(self):
+        """Письмо сброса пароля уходит воркером, а не в запросе"""
+        user = User.objects.create_user(
+            username='test_user', email='test@example.com',
+            password=PASSWORD)
+        response = self.client.post(
+            reverse('users:password_reset_email'),
+            {'email': 'test@example.com'})
+        self.assertRedirects(response, reverse('users:password_reset_done'))
+        self.assertEqual(len(mail.outbox), 0)
+        task_row = Task.objects.get()
+        self.assertEqual(task_row.queue, 'email')
+        tasks.work(['email'], burst=True)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertIn('/auth/reset/', mail.outbox[0].body)
+        # Токен выписал воркер, в аргументах задачи его не было
+        _, token = re.search(
+            r'/auth/reset/([^/]+)/([^/]+)/', mail.outbox[0].body).groups()
+        self.assertTrue(default_token_generator.check_token(user, token))
+        self.assertNotIn(token, task_row.payload)
+        self.assertNotIn('/auth/reset/', task_row.payload)
@@ -6,7 +6,7 @@ from django.contrib.auth.views import PasswordChangeView
 from django.contrib.auth.views import PasswordResetDoneView
 from django.contrib.auth.views import PasswordResetView
 from django.contrib.auth.views import PasswordResetConfirmView
-from .forms import CreationForm
+from .forms import CreationForm, QueuedPasswordResetForm
 from django.contrib.auth.forms import PasswordChangeForm
 
 
@@ -28,6 +28,7 @@ class PasswordChangeDone(PasswordChangeDoneView):
 
 
 class PasswordResetEmail(PasswordResetView):
+    form_class = QueuedPasswordResetForm
     template_name = 'users/password_reset_form.html'
     success_url = reverse_lazy('users:password_reset_done')
 
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -47,14 +49,19 @@ INSTALLED_APPS = [
     'users',
     'core',
     'about',
+    'api',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    # Первой, чтобы мерить весь запрос
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    # Сессия и пользователь читаются лениво, уже под этим middleware
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -67,7 +74,8 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга для метрик
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -88,13 +96,57 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Настройки соединений SQLite, см. core.backends.sqlite3. WAL пускает
+# читателей параллельно с писателем; synchronous=NORMAL в режиме WAL
+# не теряет целостность, только последние транзакции при отказе питания
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Сколько миллисекунд ждать блокировку, прежде чем падать
+    'busy_timeout': int(os.environ.get('YATUBE_SQLITE_BUSY_TIMEOUT', 5000)),
+    # Чтение базы через отображение в память, в байтах
+    'mmap_size': int(
+        os.environ.get('YATUBE_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Отрицательное значение - размер кеша страниц в килобайтах
+    'cache_size': int(os.environ.get('YATUBE_SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами, PRAGMA выполняются один раз
+        'CONN_MAX_AGE': int(
+            os.environ.get('YATUBE_CONN_MAX_AGE', 0 if DEBUG else 600)),
+        'OPTIONS': {
+            'pragmas': SQLITE_PRAGMAS,
+            # Писатели встают в очередь в начале транзакции, а не
+            # падают, когда транзакция начала с чтения и потом пишет
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Реплики только для чтения, через запятую:
+# YATUBE_DB_REPLICAS=/var/lib/yatube/replica1.sqlite3,...
+# В тестах реплика - зеркало основной базы
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+        filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(','))):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Сколько секунд после записи клиент читает из основной базы,
+# пока реплики догоняют её
+REPLICA_STICKY_SECONDS = 10
+REPLICA_STICKY_COOKIE = 'use_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -150,12 +202,132 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кеш выбирается переменной окружения YATUBE_CACHE_BACKEND.
+# LocMemCache живёт внутри процесса, поэтому у каждого воркера gunicorn
+# он свой; file и memcached общие для всех воркеров и инвалидация
+# через версию ленты доходит до каждого из них.
+CACHE_BACKEND = os.environ.get(
+    'YATUBE_CACHE_BACKEND', 'locmem' if DEBUG else 'file')
+CACHE_LOCATION = os.environ.get('YATUBE_CACHE_LOCATION')
+# Кешей два. В default - версии страниц, блокировки и записи о превью
+# sorl-thumbnail: их немного на каждый пост, и вытеснять их нельзя.
+# В template_fragments - целые страницы во всех представлениях и
+# фрагменты ленты: их много, и при переполнении они не вытесняют
+# версии и превью. Файловый кеш при записи сверх MAX_ENTRIES удаляет
+# треть файлов, поэтому лимит - с запасом на всю базу.
+CACHE_MAX_ENTRIES = {
+    'default': int(
+        os.environ.get('YATUBE_CACHE_MAX_ENTRIES', 200000)),
+    'template_fragments': int(
+        os.environ.get('YATUBE_FRAGMENT_CACHE_MAX_ENTRIES', 100000)),
+}
+
+
+def cache_backend(alias):
+    options = {'MAX_ENTRIES': CACHE_MAX_ENTRIES[alias]}
+    if CACHE_BACKEND == 'locmem':
+        return {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': alias,
+            'OPTIONS': options,
+        }
+    if CACHE_BACKEND == 'file':
+        return {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(
+                CACHE_LOCATION or os.path.join(BASE_DIR, 'cache'), alias),
+            'OPTIONS': options,
+        }
+    if CACHE_BACKEND == 'memcached':
+        # Memcached вытесняет сам, кеши делят сервер по префиксу
+        return {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION or '127.0.0.1:11211',
+            'KEY_PREFIX': alias,
+        }
+    raise ImproperlyConfigured(
+        f'Неизвестный YATUBE_CACHE_BACKEND: {CACHE_BACKEND}')
+
+
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    'default': cache_backend('default'),
+    'template_fragments': cache_backend('template_fragments'),
 }
 
+# Посты авторов, у которых подписчиков больше этого числа, не раскладываются
+# по лентам при записи, а догружаются читателями при открытии ленты
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько последних постов автора попадает в ленту сразу после подписки
+TIMELINE_BACKFILL_SIZE = 1000
+
+# Время жизни фрагмента ленты на главной; после записи поста фрагмент
+# обновляется сразу за счёт версии ленты в ключе
+INDEX_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Фоновая очередь задач core.tasks. В режиме отладки задачи выполняются
+# сразу при постановке, без воркера manage.py run_tasks
+TASKS_ALWAYS_EAGER = bool(int(
+    os.environ.get('YATUBE_TASKS_EAGER', 1 if DEBUG else 0)))
+# Сколько задач каждой очереди выполняется одновременно на всех воркерах
+TASK_QUEUES = {
+    'default': 4,
+    'email': 2,
+    'thumbnails': 2,
+    'timeline': 4,
+}
+# Пауза перед первым повтором упавшей задачи, дальше она удваивается
+TASK_RETRY_DELAY = 10
+# Задача, которую воркер держит дольше, возвращается в очередь
+TASK_LOCK_TIMEOUT = 60 * 10
+# Как часто воркер проверяет пустую очередь, в секундах
+TASK_POLL_INTERVAL = 1
+
+# Метаданные превью sorl-thumbnail: общий кеш, база при промахе
+# и пакетное чтение ключей для целой страницы ленты
+THUMBNAIL_KVSTORE = 'core.kvstore.KVStore'
+
+# Бэкенд поиска по постам. SQLiteFTSBackend работает только на SQLite,
+# для других баз - posts.search.SearchBackend
+POSTS_SEARCH_BACKEND = 'posts.search.SQLiteFTSBackend'
+
+# Время жизни кеша целых страниц постов, 0 - кеш выключен. В режиме
+# отладки выключен: страница из кеша отдаётся без контекста шаблона
+PAGE_CACHE_TIMEOUT = 0 if DEBUG else 60 * 60 * 6
+
+# Строка JSON на каждый запрос пишется в лог core.requests
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.requests': {
+            'handlers': ['console'],
+            'level': os.environ.get(
+                'YATUBE_REQUEST_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Каталог, через который воркеры gunicorn делятся метриками; без него
+# /metrics/ показывает только обслуживший запрос процесс
+METRICS_DIR = os.environ.get('YATUBE_METRICS_DIR')
+# Как часто, в секундах, воркер сбрасывает свои метрики в METRICS_DIR
+METRICS_FLUSH_INTERVAL = 5
+# Адреса, с которых можно забирать /metrics/. Сверяется REMOTE_ADDR,
+# поэтому список защищает, только когда сборщик ходит в приложение
+# напрямую: за nginx на той же машине все запросы приходят с 127.0.0.1
+METRICS_ALLOWED_IPS = os.environ.get(
+    'YATUBE_METRICS_ALLOWED_IPS', '127.0.0.1').split(',')
+# Токен сборщика метрик: с ним /metrics/ отвечает только на заголовок
+# «Authorization: Bearer <токен>» (bearer_token в Prometheus), как бы
+# ни был устроен прокси. За прокси его нужно задать
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]
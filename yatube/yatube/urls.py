@@ -18,9 +18,13 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core import views as core_views
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', core_views.prometheus_metrics, name='metrics'),
+    path('api/v1/', include('api.urls', namespace='api')),
     path('', include('posts.urls', namespace='posts')),
     path('group/<slug:slug>/', include('posts.urls', namespace='posts')),
     path('group_list/', include('posts.urls', namespace='posts')),